@@ -0,0 +1,94 @@
+"""
+Fan-out of worker progress events from Redis streams to API clients.
+
+Workers publish progress to `video_events` / `vehicle_count_events`. Rather
+than one XREAD per connected client, the hub runs a single reader task per
+stream while anyone is subscribed and hands each entry to the queues of the
+clients watching that video_id.
+"""
+import asyncio
+from collections import defaultdict
+
+import redis.asyncio as aioredis
+from redis.exceptions import RedisError
+
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+def decode_event(fields: dict) -> dict:
+    return {k.decode(): v.decode() for k, v in fields.items()}
+
+
+class StreamHub:
+    def __init__(self, url: str):
+        self.redis = aioredis.from_url(url)
+        # (stream, video_id) -> subscriber queues
+        self.subscribers = defaultdict(set)
+        self.readers = {}
+        # Set once a stream's reader has fixed its starting position
+        self.started = {}
+
+    async def subscribe(self, stream: str, video_id: str) -> asyncio.Queue:
+        """
+        Subscribe to one video's events. Returns once the stream's reader
+        has its starting position, so every event published after that
+        (e.g. while the caller reads the job's current status) is delivered.
+        """
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.subscribers[(stream, video_id)].add(queue)
+        if stream not in self.readers:
+            self.started[stream] = asyncio.Event()
+            self.readers[stream] = asyncio.create_task(self._read(stream, self.started[stream]))
+        try:
+            await self.started[stream].wait()
+        except BaseException:
+            self.unsubscribe(stream, video_id, queue)
+            raise
+        return queue
+
+    def unsubscribe(self, stream: str, video_id: str, queue: asyncio.Queue):
+        subs = self.subscribers.get((stream, video_id))
+        if subs is not None:
+            subs.discard(queue)
+            if not subs:
+                del self.subscribers[(stream, video_id)]
+
+    def _has_subscribers(self, stream: str) -> bool:
+        return any(s == stream for s, _ in self.subscribers)
+
+    async def _read(self, stream: str, started: asyncio.Event):
+        try:
+            # Start after the newest entry as of now. XREAD with "$" would only
+            # fix the position at its first call, and an event published before
+            # that (a job finishing right after the subscriber read its status)
+            # would never be delivered
+            try:
+                newest = await self.redis.xrevrange(stream, count=1)
+                last_id = newest[0][0] if newest else "0-0"
+            except RedisError:
+                last_id = "$"
+            started.set()
+
+            while self._has_subscribers(stream):
+                try:
+                    resp = await self.redis.xread({stream: last_id}, count=100, block=5000)
+                except RedisError:
+                    await asyncio.sleep(1)
+                    continue
+
+                for _, entries in resp or []:
+                    for entry_id, fields in entries:
+                        last_id = entry_id
+                        event = decode_event(fields)
+                        event["id"] = entry_id.decode()
+                        for queue in list(self.subscribers.get((stream, event.get("video_id")), ())):
+                            if queue.full():
+                                # Slow client: drop its oldest event rather than block everyone
+                                queue.get_nowait()
+                            queue.put_nowait(event)
+        finally:
+            # No await between the last subscriber check and this, so a new
+            # subscriber always either sees this reader or starts a new one
+            started.set()
+            self.readers.pop(stream, None)
+            self.started.pop(stream, None)
@@ -1,12 +1,24 @@
 import json
-from fastapi import FastAPI, File, Form, HTTPException, UploadFile
-from fastapi.responses import RedirectResponse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import FastAPI, File, Form, HTTPException, Request, UploadFile
+from fastapi.responses import RedirectResponse, Response, StreamingResponse
+from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
 from pymongo import MongoClient
 import boto3
 from botocore.exceptions import ClientError
-import redis, uuid, os, datetime
+import redis, uuid, os, sys, datetime, hashlib, re
 from dotenv import load_dotenv
 
+from events import StreamHub
+
+# Shared modules (common/) are copied next to this file in the image;
+# locally they live in the sibling common/ directory
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "common"))
+import lanes
+import schema
+
 load_dotenv(os.path.join(os.path.dirname(__file__), "..", ".env"))
 
 app = FastAPI()
@@ -16,6 +28,8 @@ app = FastAPI()
 mongo = MongoClient(os.getenv("MONGO_URI"))
 db = mongo[os.getenv("MONGO_DB")]
 videos = db.videos
+defects = db.defects
+road_segments = db.road_segments
 
 s3 = boto3.client(
     "s3",
@@ -26,6 +40,30 @@ s3 = boto3.client(
 
 r = redis.Redis.from_url(os.getenv("REDIS_URL"))
 
+# -------------------- JOB QUEUES --------------------
+# Each job stream has high / normal / bulk lanes (common/lanes.py), consumed
+# by the workers with weighted fair scheduling (see workers/queues.py).
+#
+# Uploads are deduplicated by content while a job is queued: an identical
+# upload gets the queued job's video_id back. It keeps that job's lane; a
+# duplicate sent with a higher priority does not promote the queued job.
+
+DEDUP_TTL_SECONDS = 24 * 3600
+# Bulk registrations hold their dedup key only this long until committed
+BULK_PENDING_TTL_SECONDS = int(os.getenv("BULK_PENDING_TTL_SECONDS", "3600"))
+BULK_MAX_ITEMS = 1000
+SHA256_RE = re.compile(r"[0-9a-fA-F]{64}")
+
+# -------------------- PROGRESS EVENTS --------------------
+# One shared Redis reader per event stream, fanned out to SSE clients
+
+VIDEO_EVENTS = "video_events"
+CCTV_EVENTS = "vehicle_count_events"
+TERMINAL_STATUSES = schema.TERMINAL_STATUSES
+KEEPALIVE_SECONDS = 15
+
+hub = StreamHub(os.getenv("REDIS_URL"))
+
 
 @app.on_event("startup")
 def ensure_bucket():
@@ -36,6 +74,11 @@ def ensure_bucket():
         pass
 
 
+@app.on_event("startup")
+def ensure_indexes():
+    schema.ensure_indexes(videos)
+
+
 # -------------------- HELPERS --------------------
 
 def _presigned_url(key: str, expires_in: int = 3600) -> str:
@@ -46,6 +89,142 @@ def _presigned_url(key: str, expires_in: int = 3600) -> str:
     )
 
 
+def _check_priority(priority: str) -> str:
+    if priority not in lanes.PRIORITIES:
+        raise HTTPException(422, f"priority must be one of {', '.join(lanes.PRIORITIES)}")
+    return priority
+
+
+def _claim_enqueue(stream: str, contents: bytes, video_id: str):
+    """
+    Reserve the dedup key for this upload's content on a job stream.
+
+    Returns (dedup_key, None) when the job should be queued, or
+    (dedup_key, existing_video_id) when an identical video is already queued.
+    Workers delete the key once the job is finished.
+    """
+    dedup_key = f"{stream}:queued:{hashlib.sha256(contents).hexdigest()}"
+    if r.set(dedup_key, video_id, nx=True, ex=DEDUP_TTL_SECONDS):
+        return dedup_key, None
+
+    existing = r.get(dedup_key)
+    if existing is None:
+        # Key expired between SET and GET; take it over
+        r.set(dedup_key, video_id, ex=DEDUP_TTL_SECONDS)
+        return dedup_key, None
+    return dedup_key, existing.decode()
+
+
+def _release_claim(dedup_key: str, video_id: str):
+    """
+    Undo _claim_enqueue after the job could not be stored or queued, so
+    identical uploads are not deduplicated onto a video that never ran.
+    Also drops the half-written document.
+    """
+    if r.get(dedup_key) == video_id.encode():
+        r.delete(dedup_key)
+    videos.delete_one({"_id": video_id})
+
+
+def _parse_roi(roi):
+    """Parse a road-area polygon (JSON or a list): >= 3 [x, y] points, pixels or 0..1."""
+    if roi is None:
+        return None
+    try:
+        polygon = json.loads(roi) if isinstance(roi, str) else roi
+    except json.JSONDecodeError:
+        raise HTTPException(422, "roi must be valid JSON")
+
+    valid = (
+        isinstance(polygon, list)
+        and len(polygon) >= 3
+        and all(
+            isinstance(p, list)
+            and len(p) == 2
+            and all(isinstance(v, (int, float)) and v >= 0 for v in p)
+            for p in polygon
+        )
+    )
+    if not valid:
+        raise HTTPException(422, "roi must be a list of at least 3 [x, y] points")
+    return polygon
+
+
+def _check_imgsz(imgsz):
+    if imgsz is not None and (imgsz < 64 or imgsz > 1920 or imgsz % 32):
+        raise HTTPException(422, "imgsz must be a multiple of 32 between 64 and 1920")
+    return imgsz
+
+
+def _tiling(tiled: bool, tile_size: int, tile_overlap: float):
+    if not tiled:
+        return None
+    _check_imgsz(tile_size)
+    if not 0 <= tile_overlap < 0.5:
+        raise HTTPException(422, "tile_overlap must be in [0, 0.5)")
+    return {"tile_size": tile_size, "overlap": tile_overlap}
+
+
+def _time_range(start_seconds: float, end_seconds: float):
+    if start_seconds is None and end_seconds is None:
+        return None
+    if (start_seconds or 0) < 0 or (end_seconds is not None and end_seconds <= (start_seconds or 0)):
+        raise HTTPException(422, "need 0 <= start_seconds < end_seconds")
+    return {"start": start_seconds, "end": end_seconds}
+
+
+def _parse_timestamp(value: str) -> datetime.datetime:
+    try:
+        ts = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        raise HTTPException(422, "timestamps must be ISO 8601, e.g. 2024-05-01T08:30:00Z")
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=datetime.timezone.utc)
+    return ts.astimezone(datetime.timezone.utc)
+
+
+def _sse(event: dict, name: str = "progress") -> str:
+    lines = [f"event: {name}"]
+    if "id" in event:
+        lines.append(f"id: {event['id']}")
+    lines.append(f"data: {json.dumps(event, default=str)}")
+    return "\n".join(lines) + "\n\n"
+
+
+def _event_response(stream: str, video_id: str, request: Request) -> StreamingResponse:
+    """Stream a job's progress as Server-Sent Events until it finishes."""
+
+    async def generate():
+        queue = await hub.subscribe(stream, video_id)
+        try:
+            # Current state first, so late subscribers are never left waiting
+            doc = await run_in_threadpool(videos.find_one, {"_id": video_id}, {"status": 1, "frames": 1})
+            if not doc:
+                yield _sse({"video_id": video_id, "error": "Video not found"}, "error")
+                return
+            yield _sse({"video_id": video_id, "status": doc.get("status")}, "status")
+            if doc.get("status") in TERMINAL_STATUSES:
+                return
+
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield _sse(event)
+                if event.get("status") in TERMINAL_STATUSES:
+                    return
+        finally:
+            hub.unsubscribe(stream, video_id, queue)
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 # -------------------- RESULT ACCESS (METHOD 1) --------------------
 # Redirects to presigned S3 URL using filename only
 
@@ -61,11 +240,43 @@ def get_result_video(filename: str):
     return RedirectResponse(_presigned_url(filename))
 
 
+# -------------------- RESULT ACCESS (HLS) --------------------
+# Workers upload annotated results as HLS segments while processing runs.
+# The playlist is served with each segment URI replaced by a presigned S3
+# URL, so players fetch only the segments they need, straight from storage.
+
+@app.get("/videos/{video_id}/playlist.m3u8")
+def get_result_playlist(video_id: str):
+    doc = videos.find_one({"_id": video_id}, {"playlist_key": 1, "status": 1})
+    if not doc or not doc.get("playlist_key"):
+        raise HTTPException(404, "Result playlist not found")
+
+    bucket = os.getenv("S3_BUCKET")
+    playlist_key = doc["playlist_key"]
+    try:
+        body = s3.get_object(Bucket=bucket, Key=playlist_key)["Body"].read().decode()
+    except ClientError:
+        raise HTTPException(404, "Result playlist not found")
+
+    prefix = playlist_key.rsplit("/", 1)[0]
+    lines = [
+        line if not line or line.startswith("#") else _presigned_url(f"{prefix}/{line}")
+        for line in body.splitlines()
+    ]
+    # Still-growing playlists must be re-fetched by players
+    cache = "no-cache" if doc.get("status") != schema.DONE else "private, max-age=300"
+    return Response(
+        "\n".join(lines) + "\n",
+        media_type="application/vnd.apple.mpegurl",
+        headers={"Cache-Control": cache},
+    )
+
+
 # -------------------- CCTV --------------------
 
 @app.get("/cctv/{video_id}")
 def get_cctv(video_id: str):
-    doc = videos.find_one({"_id": "results/" + video_id})
+    doc = videos.find_one({"_id": video_id, "source": schema.SOURCE_CCTV})
     if not doc:
         raise HTTPException(404, "Video not found")
 
@@ -92,9 +303,16 @@ def get_cctv(video_id: str):
         "video_id": doc["_id"],
         "filename": doc.get("filename"),
         "status": doc.get("status"),
+        "progress": doc.get("progress"),
         "frames": doc.get("frames"),
         "gps_coords": doc.get("gps_coords"),
         "source": doc.get("source"),
+        "roi": doc.get("roi"),
+        "inference_imgsz": doc.get("inference_imgsz"),
+        "camera_id": doc.get("camera_id"),
+        "recorded_at": doc.get("recorded_at"),
+        "severity": doc.get("severity"),
+        "vehicle_totals": doc.get("vehicle_totals"),
         "created_at": doc.get("created_at"),
         "updated_at": doc.get("updated_at"),
         "video_url": video_url,
@@ -103,9 +321,14 @@ def get_cctv(video_id: str):
     }
 
 
+@app.get("/cctv/{video_id}/events")
+async def cctv_events(video_id: str, request: Request):
+    return _event_response(CCTV_EVENTS, video_id, request)
+
+
 @app.get("/cctv")
 def list_cctv_videos():
-    docs = videos.find({"source": "CCTV"})
+    docs = videos.find({"source": schema.SOURCE_CCTV}).sort("created_at", -1)
     return [
         {
             "video_id": d["_id"],
@@ -122,11 +345,69 @@ def list_cctv_videos():
     ]
 
 
+# Per-camera traffic over time, from the minute samples and hourly/daily
+# rollups the CCTV worker writes (see workers/traffic.py)
+TRAFFIC_GRANULARITIES = {
+    "minute": ("traffic_samples", "ts", 24 * 7),
+    "hour": ("traffic_hourly", "bucket", 24 * 90),
+    "day": ("traffic_daily", "bucket", 24 * 366 * 5),
+}
+
+
+@app.get("/cctv/cameras/{camera_id}/traffic")
+def camera_traffic(camera_id: str, hours: int = 24, granularity: str = "hour", until: str = None):
+    if granularity not in TRAFFIC_GRANULARITIES:
+        raise HTTPException(422, f"granularity must be one of {list(TRAFFIC_GRANULARITIES)}")
+    collection, time_field, max_hours = TRAFFIC_GRANULARITIES[granularity]
+    if hours <= 0 or hours > max_hours:
+        raise HTTPException(422, f"hours must be in (0, {max_hours}] for {granularity} granularity")
+
+    end = _parse_timestamp(until) if until else datetime.datetime.now(datetime.timezone.utc)
+    start = end - datetime.timedelta(hours=hours)
+    docs = db[collection].find(
+        {"camera_id": camera_id, time_field: {"$gte": start, "$lte": end}},
+        {"_id": 0, "camera_id": 0, "video_id": 0, "updated_at": 0},
+    ).sort(time_field, 1)
+
+    buckets = []
+    totals = {"small": 0, "medium": 0, "heavy": 0, "total": 0}
+    for d in docs:
+        for k in totals:
+            totals[k] += d.get(k, 0)
+        buckets.append({
+            "start": d[time_field],
+            "minutes": d.get("minutes", 1),
+            **{k: d.get(k, 0) for k in totals},
+            "classes": d.get("classes", {}),
+        })
+
+    camera = db.cameras.find_one({"_id": camera_id}) or {}
+    return {
+        "camera_id": camera_id,
+        "from": start,
+        "to": end,
+        "granularity": granularity,
+        "totals": totals,
+        "buckets": buckets,
+        "severity": camera.get("severity"),
+        "severity_at": camera.get("severity_at"),
+    }
+
+
 @app.put("/cctv")
 async def upload_cctv_video(
     file: UploadFile = File(...),
     gps_coords: str = Form(...),
+    priority: str = Form("normal"),
+    roi: str = Form(None),
+    imgsz: int = Form(None),
+    camera_id: str = Form(None),
+    recorded_at: str = Form(None),
 ):
+    _check_priority(priority)
+    _check_imgsz(imgsz)
+    polygon = _parse_roi(roi)
+    recorded = _parse_timestamp(recorded_at) if recorded_at else None
     try:
         coords = json.loads(gps_coords)
     except json.JSONDecodeError:
@@ -140,30 +421,39 @@ async def upload_cctv_video(
         raise HTTPException(400, "Uploaded file is empty")
 
     video_id = str(uuid.uuid4())
+    dedup_key, existing_id = _claim_enqueue("vehicle_count_jobs", contents, video_id)
+    if existing_id:
+        return {"video_id": existing_id, "status": "QUEUED", "source": schema.SOURCE_CCTV, "deduplicated": True}
 
-    videos.insert_one({
-        "_id": video_id,
-        "source": "CCTV",
-        "filename": file.filename,
-        "status": "UPLOADED",
-        "gps_coords": coords,
-        "created_at": datetime.datetime.now(datetime.timezone.utc),
-        "updated_at": datetime.datetime.now(datetime.timezone.utc),
-    })
-
-    s3.put_object(
-        Bucket=os.getenv("S3_BUCKET"),
-        Key=f"{video_id}.mp4",
-        Body=contents,
-        ContentType=file.content_type or "video/mp4",
-    )
-
-    r.xadd(
-        "vehicle_count_jobs",
-        {"video_id": video_id, "gps_coords": json.dumps(coords)},
-    )
+    try:
+        videos.insert_one(schema.new_video(
+            video_id,
+            schema.SOURCE_CCTV,
+            filename=file.filename,
+            priority=priority,
+            gps_coords=coords,
+            roi=polygon,
+            inference_imgsz=imgsz,
+            camera_id=camera_id,
+            recorded_at=recorded,
+        ))
+
+        s3.put_object(
+            Bucket=os.getenv("S3_BUCKET"),
+            Key=f"{video_id}.mp4",
+            Body=contents,
+            ContentType=file.content_type or "video/mp4",
+        )
+
+        r.xadd(
+            lanes.lane_name("vehicle_count_jobs", priority),
+            {"video_id": video_id, "gps_coords": json.dumps(coords), "dedup_key": dedup_key},
+        )
+    except Exception:
+        _release_claim(dedup_key, video_id)
+        raise
 
-    return {"video_id": video_id, "status": "UPLOADED", "source": "CCTV"}
+    return {"video_id": video_id, "status": schema.UPLOADED, "source": schema.SOURCE_CCTV}
 
 
 # -------------------- RDD VIDEOS --------------------
@@ -172,7 +462,20 @@ async def upload_cctv_video(
 async def upload_video(
     file: UploadFile = File(...),
     gps_coords: str = Form(...),
+    priority: str = Form("normal"),
+    roi: str = Form(None),
+    tiled: bool = Form(False),
+    tile_size: int = Form(640),
+    tile_overlap: float = Form(0.2),
+    annotate: bool = Form(True),
+    start_seconds: float = Form(None),
+    end_seconds: float = Form(None),
 ):
+    _check_priority(priority)
+    polygon = _parse_roi(roi)
+    tiling = _tiling(tiled, tile_size, tile_overlap)
+    time_range = _time_range(start_seconds, end_seconds)
+
     try:
         coords = json.loads(gps_coords)
     except json.JSONDecodeError:
@@ -186,27 +489,200 @@ async def upload_video(
         raise HTTPException(400, "Uploaded file is empty")
 
     video_id = str(uuid.uuid4())
+    dedup_key, existing_id = _claim_enqueue("video_jobs", contents, video_id)
+    if existing_id:
+        return {"video_id": existing_id, "deduplicated": True}
 
-    videos.insert_one({
-        "_id": video_id,
-        "filename": file.filename,
-        "status": "UPLOADED",
-        "frames": None,
-        "gps_coords": coords,
-        "created_at": datetime.datetime.now(datetime.timezone.utc),
-        "updated_at": datetime.datetime.now(datetime.timezone.utc),
-    })
-
-    s3.put_object(
-        Bucket=os.getenv("S3_BUCKET"),
-        Key=f"{video_id}.mp4",
-        Body=contents,
-        ContentType=file.content_type or "video/mp4",
+    try:
+        videos.insert_one(schema.new_video(
+            video_id,
+            schema.SOURCE_RDD,
+            filename=file.filename,
+            priority=priority,
+            gps_coords=coords,
+            roi=polygon,
+            tiling=tiling,
+            annotate=annotate,
+            time_range=time_range,
+        ))
+
+        s3.put_object(
+            Bucket=os.getenv("S3_BUCKET"),
+            Key=f"{video_id}.mp4",
+            Body=contents,
+            ContentType=file.content_type or "video/mp4",
+        )
+
+        r.xadd(lanes.lane_name("video_jobs", priority), {"video_id": video_id, "dedup_key": dedup_key})
+    except Exception:
+        _release_claim(dedup_key, video_id)
+        raise
+
+    return {"video_id": video_id}
+
+
+# Archive backfills: register a manifest, upload the files straight to
+# object storage (see workers/backfill.py), then commit to enqueue. Each
+# step is one batched Mongo / Redis round trip for the whole manifest.
+
+class BulkVideo(BaseModel):
+    filename: str
+    sha256: str
+    size: int
+    gps_coords: list = []
+    roi: list = None
+    tiled: bool = False
+    tile_size: int = 640
+    tile_overlap: float = 0.2
+    annotate: bool = True
+    start_seconds: float = None
+    end_seconds: float = None
+
+
+class BulkManifest(BaseModel):
+    priority: str = "bulk"
+    items: list[BulkVideo]
+
+
+class BulkCommit(BaseModel):
+    video_ids: list[str]
+
+
+def _claim_enqueue_many(stream: str, digests: list, video_ids: list, ttl: int) -> list:
+    """
+    Batched _claim_enqueue for precomputed content hashes: one pipeline to
+    reserve every dedup key for `ttl` seconds, one more to read the owners
+    of those taken. Returns the owning video_id per item (its own id when
+    newly claimed).
+    """
+    keys = [f"{stream}:queued:{d}" for d in digests]
+    pipe = r.pipeline(transaction=False)
+    for key, video_id in zip(keys, video_ids):
+        pipe.set(key, video_id, nx=True, ex=ttl)
+    claimed = pipe.execute()
+
+    taken = [i for i, ok in enumerate(claimed) if not ok]
+    pipe = r.pipeline(transaction=False)
+    for i in taken:
+        pipe.get(keys[i])
+    owners = list(video_ids)
+    for i, existing in zip(taken, pipe.execute()):
+        if existing is not None:
+            owners[i] = existing.decode()
+    return owners
+
+
+@app.post("/videos/bulk")
+def register_bulk_videos(manifest: BulkManifest):
+    _check_priority(manifest.priority)
+    if not manifest.items or len(manifest.items) > BULK_MAX_ITEMS:
+        raise HTTPException(422, f"items must hold 1..{BULK_MAX_ITEMS} videos")
+
+    docs = []
+    for i, item in enumerate(manifest.items):
+        if not SHA256_RE.fullmatch(item.sha256) or item.size <= 0:
+            raise HTTPException(422, f"items[{i}]: need a hex sha256 and a positive size")
+        docs.append(schema.new_video(
+            str(uuid.uuid4()),
+            schema.SOURCE_RDD,
+            status=schema.PENDING_UPLOAD,
+            filename=item.filename,
+            priority=manifest.priority,
+            gps_coords=item.gps_coords,
+            roi=_parse_roi(item.roi),
+            tiling=_tiling(item.tiled, item.tile_size, item.tile_overlap),
+            annotate=item.annotate,
+            time_range=_time_range(item.start_seconds, item.end_seconds),
+            content_sha256=item.sha256.lower(),
+            size=item.size,
+        ))
+
+    # Uploads that are never committed release their content after
+    # BULK_PENDING_TTL_SECONDS; commit extends the claim to the full TTL
+    owners = _claim_enqueue_many(
+        "video_jobs", [d["content_sha256"] for d in docs], [d["_id"] for d in docs], BULK_PENDING_TTL_SECONDS
     )
+    new = [d for d, owner in zip(docs, owners) if owner == d["_id"]]
+    if new:
+        videos.insert_many(new, ordered=False)
+
+    existing = {
+        d["_id"]: d.get("status")
+        for d in videos.find({"_id": {"$in": list(set(owners) - {d["_id"] for d in new})}}, {"status": 1})
+    }
+    new_ids = {d["_id"] for d in new}
+    return {
+        "items": [
+            {
+                "filename": d["filename"],
+                "video_id": owner,
+                "key": f"{owner}.mp4",
+                "status": schema.PENDING_UPLOAD if owner in new_ids else existing.get(owner),
+                "deduplicated": owner != d["_id"],
+            }
+            for d, owner in zip(docs, owners)
+        ]
+    }
 
-    r.xadd("video_jobs", {"video_id": video_id})
 
-    return {"video_id": video_id}
+def _uploaded(doc: dict) -> bool:
+    """Whether the registered file is in the bucket, in full."""
+    try:
+        head = s3.head_object(Bucket=os.getenv("S3_BUCKET"), Key=f"{doc['_id']}.mp4")
+    except ClientError:
+        return False
+    return doc.get("size") is None or head.get("ContentLength") == doc["size"]
+
+
+@app.post("/videos/bulk/commit")
+def commit_bulk_videos(commit: BulkCommit):
+    if not commit.video_ids or len(commit.video_ids) > BULK_MAX_ITEMS:
+        raise HTTPException(422, f"video_ids must hold 1..{BULK_MAX_ITEMS} ids")
+
+    # Only files that actually arrived are committed; the rest stay
+    # PENDING_UPLOAD and can be committed again once uploaded
+    pending = list(videos.find(
+        {"_id": {"$in": commit.video_ids}, "status": schema.PENDING_UPLOAD},
+        {"size": 1},
+    ))
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        arrived = list(pool.map(_uploaded, pending))
+    uploaded = [d["_id"] for d, ok in zip(pending, arrived) if ok]
+    missing = [d["_id"] for d, ok in zip(pending, arrived) if not ok]
+
+    # Tag the documents this call moves out of PENDING_UPLOAD, so concurrent
+    # commits of the same ids never enqueue a video twice
+    commit_id = uuid.uuid4().hex
+    videos.update_many(
+        {"_id": {"$in": uploaded}, "status": schema.PENDING_UPLOAD},
+        {"$set": {
+            "status": schema.UPLOADED,
+            "commit_id": commit_id,
+            "updated_at": datetime.datetime.now(datetime.timezone.utc),
+        }},
+    )
+    docs = list(videos.find(
+        {"_id": {"$in": uploaded}, "commit_id": commit_id},
+        {"priority": 1, "content_sha256": 1},
+    ))
+
+    pipe = r.pipeline(transaction=False)
+    for d in docs:
+        dedup_key = f"video_jobs:queued:{d['content_sha256']}"
+        # Hold the claim while the job is queued, like single uploads
+        pipe.expire(dedup_key, DEDUP_TTL_SECONDS)
+        pipe.xadd(
+            lanes.lane_name("video_jobs", d.get("priority", "bulk")),
+            {"video_id": d["_id"], "dedup_key": dedup_key},
+        )
+    pipe.execute()
+
+    queued = {d["_id"] for d in docs}
+    return {
+        "queued": len(queued),
+        "missing": missing,
+        "skipped": [v for v in commit.video_ids if v not in queued and v not in missing],
+    }
 
 
 @app.get("/videos/{video_id}")
@@ -238,16 +714,25 @@ def get_video(video_id: str):
         "video_id": doc["_id"],
         "filename": doc.get("filename"),
         "status": doc.get("status"),
+        "progress": doc.get("progress"),
         "frames": doc.get("frames"),
         "gps_coords": doc.get("gps_coords"),
+        "roi": doc.get("roi"),
+        "tiling": doc.get("tiling"),
         "created_at": doc.get("created_at"),
         "updated_at": doc.get("updated_at"),
         "result_key": doc.get("result_key"),
         "video_url": video_url,
         "result_url": result_url,
+        "playlist_url": f"/videos/{video_id}/playlist.m3u8" if doc.get("playlist_key") else None,
     }
 
 
+@app.get("/videos/{video_id}/events")
+async def video_events(video_id: str, request: Request):
+    return _event_response(VIDEO_EVENTS, video_id, request)
+
+
 @app.get("/videos")
 def list_videos():
     docs = videos.find({})
@@ -267,6 +752,188 @@ def list_videos():
     ]
 
 
+# -------------------- DEFECTS --------------------
+# Deduplicated damage instances merged across frames and patrols by the
+# video worker (see workers/defects.py)
+
+@app.get("/defects")
+def list_defects(lat: float, lon: float, radius_m: float = 500, limit: int = 200):
+    if radius_m <= 0 or radius_m > 50000:
+        raise HTTPException(422, "radius_m must be in (0, 50000]")
+
+    docs = defects.find(
+        {"location": {"$nearSphere": {
+            "$geometry": {"type": "Point", "coordinates": [lon, lat]},
+            "$maxDistance": radius_m,
+        }}},
+        {"sightings": 0},
+    ).limit(min(limit, 1000))
+    return [
+        {
+            "defect_id": str(d["_id"]),
+            "class": d.get("class"),
+            "lat": d["location"]["coordinates"][1],
+            "lon": d["location"]["coordinates"][0],
+            "observations": d.get("observations"),
+            "max_area_px": d.get("max_area_px"),
+            "first_seen": d.get("first_seen"),
+            "last_seen": d.get("last_seen"),
+        }
+        for d in docs
+    ]
+
+
+# -------------------- ROAD SEGMENTS --------------------
+# Per-stretch damage, traffic load and risk, maintained incrementally by
+# both workers (see workers/road_segments.py)
+
+RISK_LEVELS = ["Good", "Moderate", "Poor", "Critical"]
+
+
+def _within_bbox(min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> dict:
+    if min_lat >= max_lat or min_lon >= max_lon:
+        raise HTTPException(422, "bounding box must have min < max")
+    return {"$geoWithin": {"$geometry": {
+        "type": "Polygon",
+        "coordinates": [[
+            [min_lon, min_lat], [max_lon, min_lat], [max_lon, max_lat],
+            [min_lon, max_lat], [min_lon, min_lat],
+        ]],
+    }}}
+
+
+def _check_risk(risk: str) -> str:
+    if risk not in RISK_LEVELS:
+        raise HTTPException(422, f"risk must be one of {RISK_LEVELS}")
+    return risk
+
+
+@app.get("/segments")
+def list_segments(
+    min_lat: float,
+    min_lon: float,
+    max_lat: float,
+    max_lon: float,
+    risk: str = None,
+    limit: int = 1000,
+):
+    query = {"center": _within_bbox(min_lat, min_lon, max_lat, max_lon)}
+    if risk:
+        query["risk_level"] = _check_risk(risk)
+
+    docs = road_segments.find(query).sort("risk_score", -1).limit(min(limit, 5000))
+    return [
+        {
+            "segment_id": d["_id"],
+            "lat": d["center"]["coordinates"][1],
+            "lon": d["center"]["coordinates"][0],
+            "damage": d.get("damage", {}),
+            "damage_score": d.get("damage_score", 0),
+            "traffic": d.get("traffic", {}),
+            "axle_load": d.get("axle_load", 0),
+            "risk_score": d.get("risk_score"),
+            "risk_level": d.get("risk_level"),
+            "last_patrol_at": d.get("last_patrol_at"),
+            "last_traffic_at": d.get("last_traffic_at"),
+        }
+        for d in docs
+    ]
+
+
+# -------------------- FORECASTS --------------------
+# Nightly weather-driven deterioration forecasts, cached until detections
+# or weather change (see workers/forecast.py)
+
+GROWTH_LEVELS = ["Stable", "Growing", "Rapid"]
+
+
+def _forecast_run():
+    run = db.forecast_runs.find_one({}, sort=[("finished_at", -1)])
+    if not run:
+        raise HTTPException(404, "No forecast has been computed yet")
+    return run
+
+
+@app.get("/forecasts")
+def get_forecast_run():
+    run = _forecast_run()
+    return {
+        "run_id": run["_id"],
+        "horizon_days": run.get("horizon_days"),
+        "weather": run.get("weather"),
+        "defects": run.get("defects"),
+        "segments": run.get("segments"),
+        "finished_at": run.get("finished_at"),
+    }
+
+
+@app.get("/forecasts/defects")
+def list_defect_forecasts(lat: float, lon: float, radius_m: float = 500, growth: str = None, limit: int = 200):
+    if radius_m <= 0 or radius_m > 50000:
+        raise HTTPException(422, "radius_m must be in (0, 50000]")
+    run = _forecast_run()
+    query = {"location": {"$nearSphere": {
+        "$geometry": {"type": "Point", "coordinates": [lon, lat]},
+        "$maxDistance": radius_m,
+    }}}
+    if growth:
+        if growth not in GROWTH_LEVELS:
+            raise HTTPException(422, f"growth must be one of {GROWTH_LEVELS}")
+        query["growth_level"] = growth
+
+    docs = db.defect_forecasts.find(query).limit(min(limit, 1000))
+    return {
+        "run_id": run["_id"],
+        "horizon_days": run.get("horizon_days"),
+        "defects": [
+            {
+                "defect_id": str(d["_id"]),
+                "class": d.get("class"),
+                "lat": d["location"]["coordinates"][1],
+                "lon": d["location"]["coordinates"][0],
+                "growth_factor": d.get("growth_factor"),
+                "predicted_area_px": d.get("predicted_area_px"),
+                "days_to_double": d.get("days_to_double"),
+                "growth_level": d.get("growth_level"),
+                "growth_by_day": d.get("growth_by_day"),
+            }
+            for d in docs
+        ],
+    }
+
+
+@app.get("/forecasts/segments")
+def list_segment_forecasts(
+    min_lat: float,
+    min_lon: float,
+    max_lat: float,
+    max_lon: float,
+    risk: str = None,
+    limit: int = 1000,
+):
+    run = _forecast_run()
+    query = {"center": _within_bbox(min_lat, min_lon, max_lat, max_lon)}
+    if risk:
+        query["risk_level"] = _check_risk(risk)
+
+    docs = db.segment_forecasts.find(query).sort("risk_score", -1).limit(min(limit, 5000))
+    return {
+        "run_id": run["_id"],
+        "horizon_days": run.get("horizon_days"),
+        "segments": [
+            {
+                "segment_id": d["_id"],
+                "lat": d["center"]["coordinates"][1],
+                "lon": d["center"]["coordinates"][0],
+                "damage_score": d.get("damage_score"),
+                "risk_score": d.get("risk_score"),
+                "risk_level": d.get("risk_level"),
+            }
+            for d in docs
+        ],
+    }
+
+
 @app.get("/")
 def root():
     return {"message": "Hello World"}
@@ -0,0 +1,16 @@
+"""
+Priority lanes of the Redis job streams, shared by the API and the workers.
+
+Every job stream is split into three lanes (high / normal / bulk). The
+"normal" lane keeps the original stream name so jobs queued before lanes
+existed are still picked up.
+"""
+PRIORITIES = ("high", "normal", "bulk")
+
+
+def lane_name(stream: str, priority: str) -> str:
+    return stream if priority == "normal" else f"{stream}:{priority}"
+
+
+def lane_names(stream: str) -> list:
+    return [lane_name(stream, p) for p in PRIORITIES]
@@ -0,0 +1,96 @@
+"""
+Upgrade existing `videos` documents to the current schema (see schema.py).
+
+    python common/migrate.py --dry-run
+    python common/migrate.py
+    python common/migrate.py --requeue-cctv
+
+Creates the schema's indexes, then rewrites outdated documents in
+unordered bulk writes of --batch documents. Safe to re-run: current
+documents are left alone.
+
+Before schema v2 the CCTV worker looked jobs up by a field that was never
+set and acknowledged them unprocessed, so those clips sit in UPLOADED (or
+PROCESSING) forever. --requeue-cctv puts every such clip back on its lane
+of the CCTV job stream. Run it once, with the CCTV workers stopped or
+idle: a clip a worker is processing right now would be queued again.
+"""
+import argparse
+import json
+import os
+from collections import Counter
+
+import redis
+from dotenv import load_dotenv
+from pymongo import MongoClient, UpdateOne
+
+import lanes
+import schema
+
+CCTV_STREAM = "vehicle_count_jobs"
+
+load_dotenv(os.path.join(os.path.dirname(__file__), "..", ".env"))
+
+
+def migrate(videos, batch: int = 1000, dry_run: bool = False) -> Counter:
+    stats = Counter()
+    ops = []
+    for doc in videos.find({"schema_version": {"$ne": schema.SCHEMA_VERSION}}):
+        update = schema.upgrade(doc)
+        if update is None:
+            continue
+        stats[f"from v{doc.get('schema_version', 1)}"] += 1
+        if doc.get("status") == "PROCESSED":
+            stats["PROCESSED -> DONE"] += 1
+        if dry_run:
+            continue
+        ops.append(UpdateOne({"_id": doc["_id"]}, update))
+        if len(ops) == batch:
+            stats["modified"] += videos.bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        stats["modified"] += videos.bulk_write(ops, ordered=False).modified_count
+    return stats
+
+
+def requeue_cctv(videos, r, dry_run: bool = False) -> int:
+    """Queue every CCTV clip that never finished; returns how many."""
+    stranded = videos.find(
+        {
+            "source": schema.SOURCE_CCTV,
+            # PENDING_UPLOAD clips have no file yet; the bulk commit queues them
+            "status": {"$nin": [*schema.TERMINAL_STATUSES, schema.PENDING_UPLOAD]},
+        },
+        {"priority": 1, "gps_coords": 1},
+    )
+    count = 0
+    for doc in stranded:
+        count += 1
+        if dry_run:
+            continue
+        r.xadd(
+            lanes.lane_name(CCTV_STREAM, doc.get("priority") or "normal"),
+            {"video_id": doc["_id"], "gps_coords": json.dumps(doc.get("gps_coords") or [])},
+        )
+    return count
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=f"Upgrade videos documents to schema v{schema.SCHEMA_VERSION}")
+    parser.add_argument("--batch", type=int, default=1000, help="Documents per bulk write [1000]")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would change")
+    parser.add_argument("--requeue-cctv", action="store_true",
+                        help="Also queue CCTV clips left unprocessed by the pre-v2 worker")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    videos = MongoClient(os.getenv("MONGO_URI"))[os.getenv("MONGO_DB")].videos
+    if not args.dry_run:
+        schema.ensure_indexes(videos)
+    stats = migrate(videos, args.batch, args.dry_run)
+    print(f"Schema v{schema.SCHEMA_VERSION}: {dict(stats) or 'nothing to migrate'}")
+    if args.requeue_cctv:
+        count = requeue_cctv(videos, redis.Redis.from_url(os.getenv("REDIS_URL")), args.dry_run)
+        print(f"CCTV clips {'to requeue' if args.dry_run else 'requeued'}: {count}")
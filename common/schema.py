@@ -0,0 +1,91 @@
+"""
+Versioned schema of the `videos` collection, shared by the API and both
+workers (copied next to main.py / the worker scripts in each image).
+
+Every job document, RDD patrol video or CCTV clip, is keyed by its
+video_id in `_id` and carries at least:
+
+    schema_version  SCHEMA_VERSION at write time
+    source          SOURCE_RDD | SOURCE_CCTV
+    filename, status, priority, gps_coords, frames, attempts
+    created_at, updated_at
+
+plus the source-specific request fields (roi, tiling, annotate,
+time_range, inference_imgsz, camera_id, recorded_at, content_sha256,
+size) and the results the workers add. Documents written before
+versioning (version 1) are upgraded by migrate.py.
+"""
+from datetime import datetime, timezone
+
+from pymongo import ASCENDING, DESCENDING
+
+SCHEMA_VERSION = 2
+
+SOURCE_RDD = "RDD"
+SOURCE_CCTV = "CCTV"
+
+# Job lifecycle
+PENDING_UPLOAD = "PENDING_UPLOAD"  # registered by a bulk manifest, file not yet committed
+UPLOADED = "UPLOADED"
+PROCESSING = "PROCESSING"
+RETRYING = "RETRYING"
+DONE = "DONE"
+FAILED = "FAILED"
+TERMINAL_STATUSES = {DONE, FAILED}
+
+INDEXES = [
+    ([("source", ASCENDING), ("created_at", DESCENDING)], {}),
+    ([("status", ASCENDING), ("updated_at", ASCENDING)], {}),
+    ([("schema_version", ASCENDING)], {}),
+    ([("content_sha256", ASCENDING)], {"sparse": True}),
+    ([("camera_id", ASCENDING), ("recorded_at", DESCENDING)], {"sparse": True}),
+]
+
+# Fields every current document has, with the value old documents get
+DEFAULTS = {
+    "filename": None,
+    "status": UPLOADED,
+    "priority": "normal",
+    "gps_coords": [],
+    "frames": None,
+    "attempts": 0,
+}
+
+
+def ensure_indexes(videos):
+    for keys, options in INDEXES:
+        videos.create_index(keys, **options)
+
+
+def new_video(video_id: str, source: str, status: str = UPLOADED, **fields) -> dict:
+    """A new job document; `fields` are the request fields for its source."""
+    now = datetime.now(timezone.utc)
+    return {
+        **DEFAULTS,
+        "_id": video_id,
+        "schema_version": SCHEMA_VERSION,
+        "source": source,
+        "status": status,
+        **fields,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+def upgrade(doc: dict):
+    """The update bringing `doc` to SCHEMA_VERSION, or None if it is current."""
+    if doc.get("schema_version") == SCHEMA_VERSION:
+        return None
+
+    fields = {k: v for k, v in DEFAULTS.items() if k not in doc}
+    fields["schema_version"] = SCHEMA_VERSION
+    # Version 1: only CCTV uploads were tagged, and CCTV finished as PROCESSED
+    fields["source"] = SOURCE_CCTV if doc.get("source") == SOURCE_CCTV else SOURCE_RDD
+    if doc.get("status") == "PROCESSED":
+        fields["status"] = DONE
+
+    update = {"$set": fields}
+    if "video_id" in doc:
+        # Stray lookup key from old CCTV code paths; `_id` is the video_id
+        update["$unset"] = {"video_id": ""}
+    return update
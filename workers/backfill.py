@@ -0,0 +1,256 @@
+"""
+Backfill a directory of archived patrol footage.
+
+    python backfill.py /data/patrols --api http://localhost:8000 --workers 16
+
+Instead of one POST /videos per file (whole file through the API, one
+insert, one put, one xadd each), the backfill:
+
+1. hashes every video in parallel; a GPS track is read from a sidecar
+   `<video>.gps.json` or from --gps (a JSON object keyed by relative path)
+2. registers the manifest in batches with POST /videos/bulk (one
+   insert_many and one Redis pipeline per batch)
+3. uploads the files straight to object storage with parallel multipart
+   transfers, skipping objects already there at the right size
+4. commits the uploaded batch with POST /videos/bulk/commit, which
+   enqueues all of its jobs in one pipelined round trip
+
+Progress is kept in a state file (default <dir>/.backfill-state.json)
+after every step, so an interrupted run resumes where it stopped:
+registered files keep their video_id, finished uploads are not repeated
+and committed videos are never enqueued twice. Files changed since they
+were hashed are registered again.
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
+from dotenv import load_dotenv
+
+load_dotenv(os.path.join(os.path.dirname(__file__), "..", ".env"))
+
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".mkv", ".avi")
+HASH_CHUNK = 8 * 1024 * 1024
+MB = 1024 * 1024
+
+
+class State:
+    """Per-file progress, keyed by path relative to the backfill root."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.files = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.files = json.load(f)
+
+    def update(self, rel: str, **fields):
+        with self.lock:
+            self.files.setdefault(rel, {}).update(fields)
+
+    def save(self):
+        with self.lock:
+            tmp = self.path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(self.files, f)
+            os.replace(tmp, self.path)
+
+
+def _post(api: str, path: str, body: dict) -> dict:
+    req = urllib.request.Request(
+        api.rstrip("/") + path,
+        data=json.dumps(body).encode(),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    with urllib.request.urlopen(req, timeout=300) as resp:
+        return json.loads(resp.read())
+
+
+def _sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _batches(items: list, size: int):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def scan(root: str) -> list:
+    found = []
+    for dirpath, _, names in os.walk(root):
+        for name in names:
+            if name.lower().endswith(VIDEO_EXTENSIONS):
+                found.append(os.path.relpath(os.path.join(dirpath, name), root))
+    return sorted(found)
+
+
+def gps_track(root: str, rel: str, tracks: dict) -> list:
+    if rel in tracks:
+        return tracks[rel]
+    sidecar = os.path.join(root, os.path.splitext(rel)[0] + ".gps.json")
+    if os.path.exists(sidecar):
+        with open(sidecar) as f:
+            return json.load(f)
+    return []
+
+
+def hash_files(root: str, files: list, state: State, workers: int):
+    """Hash new or changed files; changed files lose their registration."""
+    todo = []
+    for rel in files:
+        st = os.stat(os.path.join(root, rel))
+        entry = state.files.get(rel, {})
+        if entry.get("size") != st.st_size or entry.get("mtime") != st.st_mtime:
+            todo.append((rel, st))
+
+    with ThreadPoolExecutor(workers) as ex:
+        futures = {ex.submit(_sha256, os.path.join(root, rel)): (rel, st) for rel, st in todo}
+        for n, fut in enumerate(as_completed(futures), 1):
+            rel, st = futures[fut]
+            with state.lock:
+                state.files[rel] = {"size": st.st_size, "mtime": st.st_mtime, "sha256": fut.result()}
+            if n % 100 == 0:
+                print(f"Hashed {n}/{len(todo)}")
+    state.save()
+    print(f"Hashed {len(todo)} new or changed files")
+
+
+def register(args, root: str, files: list, state: State, tracks: dict):
+    pending = [rel for rel in files if "video_id" not in state.files[rel]]
+    for batch in _batches(pending, args.batch):
+        items = []
+        for rel in batch:
+            entry = state.files[rel]
+            items.append({
+                "filename": os.path.basename(rel),
+                "sha256": entry["sha256"],
+                "size": entry["size"],
+                "gps_coords": gps_track(root, rel, tracks),
+                "annotate": args.annotate,
+            })
+        resp = _post(args.api, "/videos/bulk", {"priority": args.priority, "items": items})
+        for rel, item in zip(batch, resp["items"]):
+            # A duplicate already past upload needs neither upload nor commit
+            done = item["deduplicated"] and item["status"] not in ("PENDING_UPLOAD", None)
+            state.update(rel, video_id=item["video_id"], key=item["key"],
+                         uploaded=done, committed=done, deduplicated=item["deduplicated"])
+        state.save()
+        print(f"Registered {len(batch)} videos")
+
+
+def upload(args, root: str, files: list, state: State):
+    s3 = boto3.client(
+        "s3",
+        endpoint_url=os.getenv("S3_ENDPOINT"),
+        aws_access_key_id=os.getenv("S3_ACCESS_KEY"),
+        aws_secret_access_key=os.getenv("S3_SECRET_KEY"),
+    )
+    bucket = os.getenv("S3_BUCKET")
+    config = TransferConfig(
+        multipart_threshold=args.part_mb * MB,
+        multipart_chunksize=args.part_mb * MB,
+        max_concurrency=args.part_concurrency,
+    )
+
+    def put(rel: str):
+        entry = state.files[rel]
+        try:
+            head = s3.head_object(Bucket=bucket, Key=entry["key"])
+            if head["ContentLength"] == entry["size"]:
+                return rel, "exists"
+        except ClientError:
+            pass
+        s3.upload_file(os.path.join(root, rel), bucket, entry["key"], Config=config,
+                       ExtraArgs={"ContentType": "video/mp4"})
+        return rel, "uploaded"
+
+    todo = [rel for rel in files if not state.files[rel].get("uploaded")]
+    failed = 0
+    with ThreadPoolExecutor(args.workers) as ex:
+        futures = [ex.submit(put, rel) for rel in todo]
+        for n, fut in enumerate(as_completed(futures), 1):
+            try:
+                rel, _ = fut.result()
+                state.update(rel, uploaded=True)
+            except Exception as e:
+                failed += 1
+                print(f"Upload failed: {e}")
+            if n % 50 == 0:
+                state.save()
+                print(f"Uploaded {n}/{len(todo)}")
+    state.save()
+    print(f"Uploaded {len(todo) - failed} files, {failed} failed")
+
+
+def commit(args, files: list, state: State):
+    ready = [rel for rel in files
+             if state.files[rel].get("uploaded") and not state.files[rel].get("committed")]
+    # Duplicates within the run share a video_id; enqueue it once
+    by_id = {}
+    for rel in ready:
+        by_id.setdefault(state.files[rel]["video_id"], []).append(rel)
+
+    for batch in _batches(list(by_id), args.batch):
+        resp = _post(args.api, "/videos/bulk/commit", {"video_ids": batch})
+        # The API found no complete object for these; upload them again next run
+        missing = set(resp.get("missing", []))
+        for video_id in batch:
+            for rel in by_id[video_id]:
+                if video_id in missing:
+                    state.update(rel, uploaded=False)
+                else:
+                    state.update(rel, committed=True)
+        state.save()
+        print(f"Committed {resp['queued']} videos ({len(resp['skipped'])} already queued, "
+              f"{len(missing)} not uploaded)")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Bulk-ingest a directory of patrol videos")
+    parser.add_argument("root", help="Directory to backfill (searched recursively)")
+    parser.add_argument("--api", default=os.getenv("API_URL", "http://localhost:8000"))
+    parser.add_argument("--gps", help="JSON object mapping relative paths to GPS tracks")
+    parser.add_argument("--state", help="State file [<root>/.backfill-state.json]")
+    parser.add_argument("--priority", default="bulk", choices=["high", "normal", "bulk"])
+    parser.add_argument("--no-annotate", dest="annotate", action="store_false",
+                        help="Skip annotated output (faster processing)")
+    parser.add_argument("--workers", type=int, default=8, help="Files hashed / uploaded in parallel [8]")
+    parser.add_argument("--part-mb", type=int, default=64, help="Multipart part size in MB [64]")
+    parser.add_argument("--part-concurrency", type=int, default=4, help="Parallel parts per file [4]")
+    parser.add_argument("--batch", type=int, default=500, help="Videos per API call [500]")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    root = os.path.abspath(args.root)
+    state = State(args.state or os.path.join(root, ".backfill-state.json"))
+    tracks = {}
+    if args.gps:
+        with open(args.gps) as f:
+            tracks = json.load(f)
+
+    files = scan(root)
+    print(f"Found {len(files)} videos under {root}")
+    start = time.perf_counter()
+    hash_files(root, files, state, args.workers)
+    register(args, root, files, state, tracks)
+    upload(args, root, files, state)
+    commit(args, files, state)
+
+    pending = sum(1 for rel in files if not state.files[rel].get("committed"))
+    print(f"Done in {time.perf_counter() - start:.0f}s; {pending} videos still pending (re-run to resume)")
@@ -0,0 +1,233 @@
+"""
+Benchmarks for the worker inference paths.
+
+    python bench.py backends --model models/YOLOv8_Small_RDD.pt --video sample.mp4
+    python bench.py pool --model models/yolov8n.pt --video sample.mp4 --procs 1,2,4,8
+
+`backends` runs the same frames through every inference backend (see
+inference.py) and reports per-frame latency next to detection agreement
+with the PyTorch baseline: a backend detection agrees when it has the same
+class and IoU >= 0.5 with a baseline detection.
+
+`pool` measures end-to-end decode + inference throughput of the
+shared-memory inference pool (see frame_pool.py) for each process count,
+splitting the node's cores evenly between the processes, against the
+single-process serial path.
+"""
+import argparse
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+import inference
+from frame_pool import InferencePool, cv2_reader, serial_frames
+from tiling import build_detector
+
+VARIANTS = [
+    ("torch", False),
+    ("onnx", False),
+    ("onnx", True),
+    ("openvino", False),
+    ("openvino", True),
+]
+
+
+def read_frames(path: str, limit: int) -> list:
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise RuntimeError(f"Cannot open video: {path}")
+    frames = []
+    while len(frames) < limit:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """IoU matrix between [N, 4] and [M, 4] xyxy boxes."""
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)))
+    tl = np.maximum(a[:, None, :2], b[None, :, :2])
+    br = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.prod(np.clip(br - tl, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def agreement(baseline: list, candidate: list, iou_threshold: float = 0.5):
+    """Greedy per-frame matching; returns (matched, baseline total, candidate total)."""
+    matched = n_base = n_cand = 0
+    for base, cand in zip(baseline, candidate):
+        n_base += len(base)
+        n_cand += len(cand)
+        if len(base) == 0 or len(cand) == 0:
+            continue
+        iou = box_iou(base[:, :4], cand[:, :4])
+        iou[base[:, 5][:, None] != cand[:, 5][None, :]] = 0
+        for i in np.argsort(-base[:, 4]):
+            # Best candidate box not taken by a higher-confidence baseline box
+            j = int(np.argmax(iou[i]))
+            if iou[i, j] >= iou_threshold:
+                iou[:, j] = -1
+                matched += 1
+    return matched, n_base, n_cand
+
+
+def run_variant(model, frames: list, imgsz: int, conf: float):
+    # Warm up so one-off graph compilation doesn't count
+    for frame in frames[:3]:
+        model(frame, imgsz=imgsz, conf=conf, verbose=False)
+
+    detections = []
+    start = time.perf_counter()
+    for frame in frames:
+        boxes = model(frame, imgsz=imgsz, conf=conf, verbose=False)[0].boxes
+        detections.append(boxes.data.cpu().numpy())
+    elapsed = time.perf_counter() - start
+    return detections, 1000 * elapsed / len(frames)
+
+
+def bench_backends(args):
+    frames = read_frames(args.video, args.frames)
+    if not frames:
+        raise RuntimeError("No frames decoded")
+
+    report = []
+    baseline = None
+    for backend, int8 in VARIANTS:
+        label = backend + ("-int8" if int8 else "")
+        try:
+            if backend == "torch":
+                model = inference.load_model(args.model, backend="torch")
+            else:
+                # Load the export directly so a failed export is reported, not masked
+                model = inference.YOLO(
+                    inference.export_model(args.model, backend, int8=int8, imgsz=args.imgsz),
+                    task="detect",
+                )
+        except Exception as e:
+            report.append({"variant": label, "error": str(e)})
+            continue
+
+        detections, ms = run_variant(model, frames, args.imgsz, args.conf)
+        row = {"variant": label, "ms_per_frame": round(ms, 2), "fps": round(1000 / ms, 1)}
+        if baseline is None:
+            baseline = (detections, ms)
+        matched, n_base, n_cand = agreement(baseline[0], detections)
+        row.update({
+            "speedup": round(baseline[1] / ms, 2),
+            "detections": n_cand,
+            "recall_vs_torch": round(matched / n_base, 3) if n_base else None,
+            "precision_vs_torch": round(matched / n_cand, 3) if n_cand else None,
+        })
+        report.append(row)
+
+    print(f"{len(frames)} frames, imgsz={args.imgsz}, conf={args.conf}")
+    print(f"{'variant':<16}{'ms/frame':>10}{'speedup':>9}{'recall':>8}{'prec':>8}{'dets':>7}")
+    for row in report:
+        if "error" in row:
+            print(f"{row['variant']:<16}  unavailable: {row['error']}")
+            continue
+        print(
+            f"{row['variant']:<16}{row['ms_per_frame']:>10}{row['speedup']:>9}"
+            f"{str(row['recall_vs_torch']):>8}{str(row['precision_vs_torch']):>8}{row['detections']:>7}"
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+def _throughput(video: str, limit: int, run) -> float:
+    cap = cv2.VideoCapture(video)
+    if not cap.isOpened():
+        raise RuntimeError(f"Cannot open video: {video}")
+    shape = (int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), 3)
+    read = cv2_reader(cap)
+
+    def read_limited(buf):
+        nonlocal limit
+        limit -= 1
+        return limit >= 0 and read(buf)
+
+    frames = 0
+    start = time.perf_counter()
+    for _ in run(read_limited, shape):
+        frames += 1
+    elapsed = time.perf_counter() - start
+    cap.release()
+    return frames / elapsed
+
+
+def bench_pool(args):
+    spec = {"conf": args.conf, "imgsz": args.imgsz}
+    cores = os.cpu_count() or 1
+    report = []
+
+    # Pools first: forking after this process has run torch inference can
+    # deadlock the children's OpenMP thread pools
+    for n in [int(p) for p in args.procs.split(",")]:
+        pool = InferencePool(args.model, n, threads=max(1, cores // n))
+        try:
+            # One short warm-up pass so model loading isn't timed
+            _throughput(args.video, 2 * n, lambda read, shape: pool.run(read, shape, spec))
+            fps = _throughput(args.video, args.frames, lambda read, shape: pool.run(read, shape, spec))
+        finally:
+            pool.close()
+        report.append({"mode": "pool", "processes": n, "threads": pool.threads, "fps": round(fps, 1)})
+
+    model = inference.load_model(args.model)
+    fps = _throughput(
+        args.video, args.frames,
+        lambda read, shape: serial_frames(read, shape, build_detector(model, spec, shape[1], shape[0])),
+    )
+    report.insert(0, {"mode": "serial", "processes": 1, "threads": cores, "fps": round(fps, 1)})
+
+    base = report[0]["fps"]
+    print(f"{args.frames} frames, {cores} cores, imgsz={args.imgsz}")
+    print(f"{'mode':<8}{'procs':>6}{'threads':>9}{'fps':>8}{'speedup':>9}")
+    for row in report:
+        row["speedup"] = round(row["fps"] / base, 2)
+        print(f"{row['mode']:<8}{row['processes']:>6}{row['threads']:>9}{row['fps']:>8}{row['speedup']:>9}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Worker inference benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    backends = sub.add_parser("backends", help="Compare inference backends against PyTorch")
+    backends.add_argument("--model", required=True, help="Path to the .pt model")
+    backends.add_argument("--video", required=True, help="Sample video to run on")
+    backends.add_argument("--frames", type=int, default=200, help="Frames to benchmark [200]")
+    backends.add_argument("--imgsz", type=int, default=inference.DEFAULT_IMGSZ)
+    backends.add_argument("--conf", type=float, default=0.25)
+    backends.add_argument("--json", help="Also write the report to this file")
+    backends.set_defaults(func=bench_backends)
+
+    pool = sub.add_parser("pool", help="Scale the shared-memory inference pool from 1 to N processes")
+    pool.add_argument("--model", required=True, help="Path to the .pt model")
+    pool.add_argument("--video", required=True, help="Sample video to run on")
+    pool.add_argument("--frames", type=int, default=300, help="Frames per run [300]")
+    pool.add_argument("--procs", default="1,2,4", help="Comma-separated process counts [1,2,4]")
+    pool.add_argument("--imgsz", type=int, default=inference.DEFAULT_IMGSZ)
+    pool.add_argument("--conf", type=float, default=0.25)
+    pool.add_argument("--json", help="Also write the report to this file")
+    pool.set_defaults(func=bench_pool)
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    args.func(args)
@@ -0,0 +1,267 @@
+"""
+Damage instances: one record per physical defect, not per detected box.
+
+Within a video, RDD detections are tracked across frames with SORT (one
+tracker per class) so a pothole visible for 40 frames becomes one instance.
+Each instance is geotagged by interpolating the job's gps_coords over the
+video timeline, and then merged into the persistent `defects` collection:
+an instance within DEFECT_MERGE_DISTANCE_M of a known defect of the same
+class is another sighting of it, otherwise it is a new defect. Known
+defects near a job are fetched with one 2dsphere-indexed query over the
+job's bounding box and matched in memory, so a merge costs one round trip
+for the lookup however many instances the job found. Merging is
+idempotent per video: a retried job finds the defects it created
+(`found_by`) and its own sightings, and changes nothing twice.
+"""
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+from pymongo import GEOSPHERE, ASCENDING, InsertOne, UpdateOne
+
+from sort import Sort
+
+MERGE_DISTANCE_M = float(os.getenv("DEFECT_MERGE_DISTANCE_M", "5"))
+MIN_HITS = 3
+MAX_AGE = 5
+RECENT_SIGHTINGS = 20
+EARTH_RADIUS_M = 6371000.0
+
+
+def ensure_indexes(defects):
+    defects.create_index([("location", GEOSPHERE), ("class", ASCENDING)])
+
+
+# ---------- GPS TRACK ----------
+
+def parse_track(gps_coords):
+    """
+    Normalise a job's gps_coords to (points, times).
+
+    Accepts a single [lat, lon], a list of [lat, lon] / [lat, lon, t] points,
+    or a list of {"lat", "lon"/"lng", "t"} dicts. `points` is a [K, 2] array
+    of (lat, lon); `times` holds seconds from the start of the video, or is
+    None when the track has no timestamps (points are then assumed evenly
+    spaced over the video).
+    """
+    if not gps_coords:
+        return None, None
+    if isinstance(gps_coords[0], (int, float)):
+        gps_coords = [gps_coords]
+
+    points, times = [], []
+    for p in gps_coords:
+        if isinstance(p, dict):
+            lat = p.get("lat", p.get("latitude"))
+            lon = p.get("lon", p.get("lng", p.get("longitude")))
+            t = p.get("t")
+        elif isinstance(p, (list, tuple)) and len(p) >= 2:
+            lat, lon = p[0], p[1]
+            t = p[2] if len(p) > 2 else None
+        else:
+            continue
+        if not isinstance(lat, (int, float)) or not isinstance(lon, (int, float)):
+            continue
+        points.append((float(lat), float(lon)))
+        times.append(t)
+
+    if not points:
+        return None, None
+    if all(isinstance(t, (int, float)) for t in times):
+        return np.array(points), np.array(times, dtype=np.float64)
+    return np.array(points), None
+
+
+def geotag(points: np.ndarray, times, t: np.ndarray, duration: float) -> np.ndarray:
+    """Interpolate (lat, lon) at video times `t` (seconds); returns [N, 2]."""
+    if len(points) == 1:
+        return np.repeat(points, len(t), axis=0)
+    if times is None:
+        times = np.linspace(0.0, max(duration, 1e-6), len(points))
+    return np.stack([np.interp(t, times, points[:, 0]), np.interp(t, times, points[:, 1])], axis=1)
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+
+# ---------- TRACKING ----------
+
+class DamageTracker:
+    """Tracks RDD detections across frames and accumulates per-instance stats."""
+
+    def __init__(self, min_hits: int = MIN_HITS, max_age: int = MAX_AGE):
+        self.min_hits = min_hits
+        self.max_age = max_age
+        self.sorts = {}
+        self.instances = {}
+        # Confirmed instances carried over from a checkpoint
+        self.restored = []
+
+    def update(self, frame_idx: int, detections: np.ndarray):
+        """Feed one frame's [N, 6] detections."""
+        for cls_id in np.unique(detections[:, 5]).astype(int).tolist():
+            if cls_id not in self.sorts:
+                self.sorts[cls_id] = Sort(max_age=self.max_age, min_hits=self.min_hits, iou_threshold=0.2)
+        # Every SORT must see every frame, even with no detections of its class
+        for cls_id, sort in self.sorts.items():
+            dets = detections[detections[:, 5] == cls_id, :5]
+            for x1, y1, x2, y2, tid in sort.update(dets if len(dets) else np.empty((0, 5))):
+                area = float((x2 - x1) * (y2 - y1))
+                inst = self.instances.setdefault(int(tid), {
+                    "class_id": cls_id,
+                    "first_frame": frame_idx,
+                    "hits": 0,
+                    "max_area_px": 0.0,
+                })
+                inst["last_frame"] = frame_idx
+                inst["hits"] += 1
+                inst["max_area_px"] = max(inst["max_area_px"], area)
+
+    def confirmed(self) -> list:
+        return self.restored + [i for i in self.instances.values() if i["hits"] >= self.min_hits]
+
+    def state(self) -> list:
+        """Checkpointable state: the confirmed instances so far."""
+        return [dict(i) for i in self.confirmed()]
+
+    def restore(self, state: list):
+        # SORT tracks themselves are not restored; a defect visible across
+        # the resume point becomes two instances, which merge_into() clusters
+        self.restored = [dict(i) for i in state]
+
+
+def summarize(instances: list, names: dict, gps_coords, fps: float, frame_count: int) -> list:
+    """Attach class names and interpolated locations to confirmed instances."""
+    points, times = parse_track(gps_coords)
+    out = []
+    if points is not None and instances:
+        mid = np.array([(i["first_frame"] + i["last_frame"]) / 2 for i in instances]) / fps
+        locations = geotag(points, times, mid, frame_count / fps)
+    else:
+        locations = [None] * len(instances)
+
+    for inst, loc in zip(instances, locations):
+        out.append({
+            "class": names[inst["class_id"]],
+            "first_frame": inst["first_frame"],
+            "last_frame": inst["last_frame"],
+            "hits": inst["hits"],
+            "max_area_px": round(inst["max_area_px"], 1),
+            "lat": None if loc is None else float(loc[0]),
+            "lon": None if loc is None else float(loc[1]),
+        })
+    return out
+
+
+# ---------- PERSISTENCE ----------
+
+def _cluster(instances: list, radius_m: float) -> list:
+    """Greedy same-class clustering so one job never creates the same defect twice."""
+    clusters = []
+    for inst in sorted(instances, key=lambda i: -i["hits"]):
+        for c in clusters:
+            if c["class"] == inst["class"] and haversine_m(c["lat"], c["lon"], inst["lat"], inst["lon"]) <= radius_m:
+                c["hits"] += inst["hits"]
+                c["max_area_px"] = max(c["max_area_px"], inst["max_area_px"])
+                break
+        else:
+            clusters.append(dict(inst))
+    return clusters
+
+
+def _candidates(defects, clusters: list, radius_m: float) -> dict:
+    """
+    Known defects within radius_m of the clusters' bounding box, grouped by
+    class as (ids, lats, lons) arrays. One query for the whole batch.
+    """
+    if not clusters:
+        return {}
+    lats = np.array([c["lat"] for c in clusters])
+    lons = np.array([c["lon"] for c in clusters])
+    # Pad by the merge radius, with some slack for the box's geodesic edges
+    pad_lat = 2 * np.degrees(radius_m / EARTH_RADIUS_M)
+    pad_lon = pad_lat / max(np.cos(np.radians(min(np.abs(lats).max() + pad_lat, 89.0))), 1e-6)
+    south, north = float(max(lats.min() - pad_lat, -90.0)), float(min(lats.max() + pad_lat, 90.0))
+    west, east = float(max(lons.min() - pad_lon, -180.0)), float(min(lons.max() + pad_lon, 180.0))
+    box = {"type": "Polygon", "coordinates": [[
+        [west, south], [east, south], [east, north], [west, north], [west, south],
+    ]]}
+
+    found = {}
+    for doc in defects.find(
+        {
+            "class": {"$in": sorted({c["class"] for c in clusters})},
+            "location": {"$geoWithin": {"$geometry": box}},
+        },
+        {"class": 1, "location": 1, "found_by": 1, "sightings.video_id": 1},
+    ):
+        lon, lat = doc["location"]["coordinates"]
+        found.setdefault(doc["class"], []).append((doc, lat, lon))
+    return {
+        cls: ([d[0] for d in docs], np.array([d[1] for d in docs]), np.array([d[2] for d in docs]))
+        for cls, docs in found.items()
+    }
+
+
+def merge_into(defects, instances: list, video_id: str, radius_m: float = MERGE_DISTANCE_M) -> dict:
+    """
+    Merge geotagged instances into the `defects` collection.
+
+    Returns {"new": n, "merged": m, "created": [{"class", "lat", "lon"}]}.
+    Instances without a location are skipped. Safe to repeat for the same
+    video: defects it created still count as new, nothing is written twice.
+    """
+    located = [i for i in instances if i["lat"] is not None]
+    now = datetime.now(timezone.utc)
+    ops = []
+    merged = 0
+    created = []
+
+    clusters = _cluster(located, radius_m)
+    candidates = _candidates(defects, clusters, radius_m)
+    for inst in clusters:
+        point = {"type": "Point", "coordinates": [inst["lon"], inst["lat"]]}
+        sighting = {"video_id": video_id, "seen_at": now, "area_px": inst["max_area_px"]}
+        known = None
+        if inst["class"] in candidates:
+            docs, lats, lons = candidates[inst["class"]]
+            dist = haversine_m(inst["lat"], inst["lon"], lats, lons)
+            nearest = int(np.argmin(dist))
+            if dist[nearest] <= radius_m:
+                known = docs[nearest]
+        if known and known.get("found_by") == video_id:
+            # Created by an earlier attempt of this job
+            created.append({"class": inst["class"], "lat": inst["lat"], "lon": inst["lon"]})
+        elif known:
+            merged += 1
+            if any(s.get("video_id") == video_id for s in known.get("sightings", [])):
+                continue
+            ops.append(UpdateOne({"_id": known["_id"], "sightings.video_id": {"$ne": video_id}}, {
+                "$inc": {"observations": 1, "detections": inst["hits"]},
+                "$max": {"max_area_px": inst["max_area_px"]},
+                "$set": {"last_seen": now, "last_area_px": inst["max_area_px"], "updated_at": now},
+                "$push": {"sightings": {"$each": [sighting], "$slice": -RECENT_SIGHTINGS}},
+            }))
+        else:
+            created.append({"class": inst["class"], "lat": inst["lat"], "lon": inst["lon"]})
+            ops.append(InsertOne({
+                "class": inst["class"],
+                "location": point,
+                "observations": 1,
+                "detections": inst["hits"],
+                "max_area_px": inst["max_area_px"],
+                "last_area_px": inst["max_area_px"],
+                "first_seen": now,
+                "last_seen": now,
+                "sightings": [sighting],
+                "found_by": video_id,
+                "created_at": now,
+                "updated_at": now,
+            }))
+
+    if ops:
+        defects.bulk_write(ops, ordered=False)
+    return {"new": len(created), "merged": merged, "created": created}
@@ -0,0 +1,368 @@
+"""
+Weather-driven deterioration forecasts for known defects and road segments.
+
+    python forecast.py --days 14 --weather weather.json    # nightly
+    python forecast.py --force                             # ignore the cache
+
+Every defect grows by a daily rate that depends on its class (potholes
+fastest), the rain and freeze-thaw cycles forecast for its area, and the
+heavy-vehicle load on its road segment:
+
+    rate[d, i] = BASE_RATE[class_i] * (1 + RAIN_COEF * rain_mm[d, cell_i])
+                 * (1 + FREEZE_THAW_COEF * freeze_thaw[d, cell_i])
+                 * (1 + LOAD_COEF * ln(1 + axle_load_i))
+    growth[d, i] = prod_{k <= d} (1 + rate[k, i])
+
+The whole [days x defects] grid is one NumPy pass: defects are matched to
+segments and weather cells through integer geohash codes, never a
+per-defect Python loop. Segment forecasts add each defect's weighted
+growth to the segment's damage score and re-score its risk with the same
+formula as road_segments.py.
+
+Results go to `defect_forecasts` and `segment_forecasts`, and the run is
+recorded in `forecast_runs` under a fingerprint of its inputs (defect and
+segment counts and latest updates, the weather data, the parameters). A
+run with an unchanged fingerprint is skipped, so forecasts stay cached
+until new detections or new weather arrive.
+
+Weather file (FORECAST_WEATHER_FILE), JSON with one row per day:
+
+    {"days": [{"date": "2024-05-01", "rain_mm": 12.5, "freeze_thaw": 0}, ...],
+     "cells": {"tdr1": [{"date": ..., "rain_mm": ..., "freeze_thaw": ...}, ...]}}
+
+`days` is the default series; `cells` optionally overrides it per geohash
+cell of WEATHER_CELL_PRECISION characters. Rows are placed by their date,
+counted from today (UTC); rows outside the horizon are ignored. Without a
+file, or on days it does not cover, a stub provider supplies
+FORECAST_STUB_RAIN_MM of rain a day.
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from datetime import date, datetime, timezone
+
+import numpy as np
+from dotenv import load_dotenv
+from pymongo import ASCENDING, DESCENDING, GEOSPHERE, MongoClient, ReplaceOne
+
+import road_segments
+
+load_dotenv(os.path.join(os.path.dirname(__file__), "..", ".env"))
+
+MODEL_VERSION = 1
+DEFAULT_DAYS = int(os.getenv("FORECAST_DAYS", "14"))
+WEATHER_FILE = os.getenv("FORECAST_WEATHER_FILE")
+STUB_RAIN_MM = float(os.getenv("FORECAST_STUB_RAIN_MM", "2.0"))
+WEATHER_CELL_PRECISION = 4  # ~39 km x 20 km
+WRITE_BATCH = 5000
+
+# Daily area growth in dry weather, by class; matched like DAMAGE_WEIGHTS
+BASE_RATES = [
+    (("pothole", "d40"), 0.02),
+    (("alligator", "d20"), 0.012),
+]
+DEFAULT_BASE_RATE = 0.006
+RAIN_COEF = 0.04          # per mm of rain that day
+FREEZE_THAW_COEF = 0.5    # on days with a freeze-thaw cycle
+LOAD_COEF = 0.05          # per ln(1 + equivalent axle load)
+
+# Growth factor bands reported per defect
+GROWTH_LEVELS = [(1.25, "Stable"), (2.0, "Growing")]  # above: Rapid
+
+
+# ---------- WEATHER ----------
+
+def _series(rows: list, days: int, start: date) -> np.ndarray:
+    """
+    [2, days] array of (rain_mm, freeze_thaw) for the days from `start`,
+    placed by each row's date; days without a row get the stub.
+    """
+    out = np.zeros((2, days), dtype=np.float32)
+    out[0] = STUB_RAIN_MM
+    for row in rows:
+        try:
+            d = (date.fromisoformat(row["date"]) - start).days
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"weather row {row!r} needs an ISO \"date\"") from None
+        if 0 <= d < days:
+            out[0, d] = row.get("rain_mm", STUB_RAIN_MM)
+            out[1, d] = 1.0 if row.get("freeze_thaw") else 0.0
+    return out
+
+
+def load_weather(path: str, days: int, start: date = None):
+    """
+    (cell_codes [C], weather [C + 1, 2, days], digest) for the days from
+    `start` (default: today, UTC). Row 0 is the default series; row k + 1
+    belongs to cell_codes[k] (sorted).
+    """
+    start = start or datetime.now(timezone.utc).date()
+    if not path:
+        digest = hashlib.sha256(f"stub:{STUB_RAIN_MM}".encode()).hexdigest()
+        return np.empty(0, dtype=np.int64), _series([], days, start)[None], digest
+
+    with open(path, "rb") as f:
+        raw = f.read()
+    data = json.loads(raw)
+    cells = sorted(data.get("cells", {}).items(), key=lambda kv: road_segments.geohash_int(kv[0]))
+    for code, _ in cells:
+        if len(code) != WEATHER_CELL_PRECISION:
+            raise ValueError(f"weather cell {code!r} must have {WEATHER_CELL_PRECISION} characters")
+
+    codes = np.array([road_segments.geohash_int(code) for code, _ in cells], dtype=np.int64)
+    weather = np.stack(
+        [_series(data.get("days", []), days, start)] + [_series(rows, days, start) for _, rows in cells]
+    )
+    # The same file gives a different series on another day
+    return codes, weather, hashlib.sha256(raw + start.isoformat().encode()).hexdigest()
+
+
+def _lookup(keys: np.ndarray, table: np.ndarray) -> np.ndarray:
+    """Index of each key in sorted `table`, or -1."""
+    if len(table) == 0:
+        return np.full(len(keys), -1, dtype=np.int64)
+    pos = np.clip(np.searchsorted(table, keys), 0, len(table) - 1)
+    return np.where(table[pos] == keys, pos, -1)
+
+
+# ---------- MODEL ----------
+
+def _class_table(values: list, default: float, lookup: list) -> np.ndarray:
+    table = np.full(len(values), default, dtype=np.float32)
+    for i, name in enumerate(values):
+        name = name.lower()
+        for keys, v in lookup:
+            if any(k in name for k in keys):
+                table[i] = v
+                break
+    return table
+
+
+def grow(base_rate: np.ndarray, load: np.ndarray, rain: np.ndarray, freeze_thaw: np.ndarray) -> np.ndarray:
+    """
+    Cumulative growth [days, N] from per-defect base rates and loads [N] and
+    per-defect daily weather [days, N].
+    """
+    rate = (
+        base_rate[None, :]
+        * (1 + RAIN_COEF * rain)
+        * (1 + FREEZE_THAW_COEF * freeze_thaw)
+        * (1 + LOAD_COEF * np.log1p(load))[None, :]
+    )
+    return np.cumprod(1 + rate, axis=0)
+
+
+def forecast(defects: dict, segments: dict, cell_codes: np.ndarray, weather: np.ndarray) -> tuple:
+    """
+    Vectorized forecast over column arrays:
+
+        defects   class (names [N]), lat, lon, area
+        segments  code [S] (sorted), damage_score, axle_load
+
+    Returns (per-defect columns, per-segment columns).
+    """
+    classes, class_idx = np.unique(defects["class"], return_inverse=True)
+    base_rate = _class_table(classes.tolist(), DEFAULT_BASE_RATE, BASE_RATES)[class_idx]
+    weight = _class_table(classes.tolist(), road_segments.DEFAULT_DAMAGE_WEIGHT,
+                          road_segments.DAMAGE_WEIGHTS)[class_idx]
+
+    codes = road_segments.geohash_codes(defects["lat"], defects["lon"])
+    seg_idx = _lookup(codes, segments["code"])
+    # Trailing zero for defects off every known segment (seg_idx -1); also
+    # keeps the lookup valid when there are no segments at all
+    load = np.append(segments["axle_load"], 0.0)[seg_idx].astype(np.float32)
+
+    cell_shift = 5 * (road_segments.PRECISION - WEATHER_CELL_PRECISION)
+    cell = _lookup(codes >> cell_shift, cell_codes) + 1  # 0 = default series
+    daily = weather[cell]  # [N, 2, days]
+    growth = grow(base_rate, load, daily[:, 0, :].T, daily[:, 1, :].T)
+
+    horizon = growth[-1]
+    doubled = growth >= 2.0
+    days_to_double = np.where(doubled.any(axis=0), doubled.argmax(axis=0) + 1, -1)
+    levels = np.array([level for _, level in GROWTH_LEVELS] + ["Rapid"])
+    growth_level = levels[np.searchsorted([limit for limit, _ in GROWTH_LEVELS], horizon, side="right")]
+
+    # Segment damage grows with the weighted growth of its defects
+    added = np.zeros(len(segments["code"]), dtype=np.float64)
+    located = seg_idx >= 0
+    np.add.at(added, seg_idx[located], weight[located] * (horizon[located] - 1))
+    damage = segments["damage_score"] + added
+    risk = damage * (1 + road_segments.LOAD_FACTOR * np.log(1 + segments["axle_load"]))
+    risk_levels = np.array([level for _, level in road_segments.RISK_LEVELS] + ["Critical"])
+    risk_level = risk_levels[np.searchsorted([limit for limit, _ in road_segments.RISK_LEVELS], risk, side="right")]
+
+    return (
+        {
+            "growth_factor": horizon,
+            "predicted_area_px": defects["area"] * horizon,
+            "days_to_double": days_to_double,
+            "growth_level": growth_level,
+            "growth_by_day": growth.T,
+        },
+        {
+            "damage_score": damage,
+            "risk_score": risk,
+            "risk_level": risk_level,
+        },
+    )
+
+
+# ---------- STORAGE ----------
+
+def ensure_indexes(db):
+    # The input fingerprint reads the latest update of each source
+    db.defects.create_index([("updated_at", DESCENDING)])
+    db.road_segments.create_index([("updated_at", DESCENDING)])
+    db.defect_forecasts.create_index([("location", GEOSPHERE)])
+    db.defect_forecasts.create_index([("run_id", ASCENDING)])
+    db.segment_forecasts.create_index([("center", GEOSPHERE)])
+    db.segment_forecasts.create_index([("run_id", ASCENDING)])
+    db.forecast_runs.create_index([("finished_at", DESCENDING)])
+
+
+def _fingerprint(db, weather_digest: str, days: int) -> str:
+    parts = {"model": MODEL_VERSION, "days": days, "weather": weather_digest,
+             "params": [BASE_RATES, DEFAULT_BASE_RATE, RAIN_COEF, FREEZE_THAW_COEF, LOAD_COEF, STUB_RAIN_MM]}
+    for name in ("defects", "road_segments"):
+        latest = db[name].find_one({}, {"updated_at": 1}, sort=[("updated_at", DESCENDING)])
+        parts[name] = [db[name].estimated_document_count(), str(latest and latest.get("updated_at"))]
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _load_defects(db) -> tuple:
+    ids, cls, lat, lon, area = [], [], [], [], []
+    for d in db.defects.find({}, {"class": 1, "location": 1, "last_area_px": 1, "max_area_px": 1}):
+        ids.append(d["_id"])
+        cls.append(d["class"])
+        lon.append(d["location"]["coordinates"][0])
+        lat.append(d["location"]["coordinates"][1])
+        area.append(d.get("last_area_px") or d.get("max_area_px") or 0)
+    return ids, {
+        "class": np.array(cls, dtype=object),
+        "lat": np.array(lat, dtype=np.float64),
+        "lon": np.array(lon, dtype=np.float64),
+        "area": np.array(area, dtype=np.float32),
+    }
+
+
+def _load_segments(db) -> tuple:
+    docs = list(db.road_segments.find({}, {"center": 1, "damage_score": 1, "axle_load": 1}))
+    codes = np.array([road_segments.geohash_int(d["_id"]) for d in docs], dtype=np.int64)
+    order = np.argsort(codes)
+    docs = [docs[i] for i in order]
+    return docs, {
+        "code": codes[order],
+        "damage_score": np.array([d.get("damage_score", 0) for d in docs], dtype=np.float64),
+        "axle_load": np.array([d.get("axle_load", 0) for d in docs], dtype=np.float64),
+    }
+
+
+def _write(collection, docs):
+    batch = []
+    for doc in docs:
+        batch.append(ReplaceOne({"_id": doc["_id"]}, doc, upsert=True))
+        if len(batch) == WRITE_BATCH:
+            collection.bulk_write(batch, ordered=False)
+            batch = []
+    if batch:
+        collection.bulk_write(batch, ordered=False)
+
+
+def run(db, days: int = DEFAULT_DAYS, weather_path: str = WEATHER_FILE, force: bool = False) -> dict:
+    if days < 1:
+        raise ValueError("forecast horizon must be at least 1 day")
+    cell_codes, weather, digest = load_weather(weather_path, days)
+    run_id = _fingerprint(db, digest, days)
+    cached = db.forecast_runs.find_one({"_id": run_id})
+    if cached and not force:
+        print(f"Forecast inputs unchanged since {cached['finished_at']}; keeping run {run_id[:12]}")
+        return cached
+
+    started = time.perf_counter()
+    defect_ids, defect_cols = _load_defects(db)
+    segment_docs, segment_cols = _load_segments(db)
+    loaded = time.perf_counter()
+
+    per_defect, per_segment = forecast(defect_cols, segment_cols, cell_codes, weather)
+    computed = time.perf_counter()
+
+    now = datetime.now(timezone.utc)
+    growth_by_day = np.round(per_defect["growth_by_day"], 4)
+    _write(db.defect_forecasts, (
+        {
+            "_id": _id,
+            "run_id": run_id,
+            "class": defect_cols["class"][i],
+            "location": {"type": "Point", "coordinates": [float(defect_cols["lon"][i]),
+                                                          float(defect_cols["lat"][i])]},
+            "horizon_days": days,
+            "growth_factor": round(float(per_defect["growth_factor"][i]), 4),
+            "predicted_area_px": round(float(per_defect["predicted_area_px"][i]), 1),
+            "days_to_double": int(per_defect["days_to_double"][i]) if per_defect["days_to_double"][i] > 0 else None,
+            "growth_level": str(per_defect["growth_level"][i]),
+            "growth_by_day": growth_by_day[i].tolist(),
+            "created_at": now,
+        }
+        for i, _id in enumerate(defect_ids)
+    ))
+    _write(db.segment_forecasts, (
+        {
+            "_id": d["_id"],
+            "run_id": run_id,
+            "center": d["center"],
+            "horizon_days": days,
+            "damage_score": round(float(per_segment["damage_score"][i]), 3),
+            "risk_score": round(float(per_segment["risk_score"][i]), 3),
+            "risk_level": str(per_segment["risk_level"][i]),
+            "created_at": now,
+        }
+        for i, d in enumerate(segment_docs)
+    ))
+
+    # Drop forecasts for defects and segments that no longer exist
+    db.defect_forecasts.delete_many({"run_id": {"$ne": run_id}})
+    db.segment_forecasts.delete_many({"run_id": {"$ne": run_id}})
+    written = time.perf_counter()
+
+    summary = {
+        "_id": run_id,
+        "horizon_days": days,
+        "weather": weather_path or "stub",
+        "defects": len(defect_ids),
+        "segments": len(segment_docs),
+        "timings_s": {
+            "load": round(loaded - started, 2),
+            "compute": round(computed - loaded, 2),
+            "write": round(written - computed, 2),
+        },
+        "finished_at": datetime.now(timezone.utc),
+    }
+    db.forecast_runs.replace_one({"_id": run_id}, summary, upsert=True)
+    print(f"Forecast {run_id[:12]}: {summary['defects']} defects, {summary['segments']} segments, "
+          f"{summary['timings_s']}")
+    return summary
+
+
+def _days(value: str) -> int:
+    days = int(value)
+    if days < 1:
+        raise argparse.ArgumentTypeError("must be at least 1")
+    return days
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Forecast defect growth and road-segment risk")
+    parser.add_argument("--days", type=_days, default=DEFAULT_DAYS, help=f"Forecast horizon [{DEFAULT_DAYS}]")
+    parser.add_argument("--weather", default=WEATHER_FILE, help="Weather forecast JSON (default: stub)")
+    parser.add_argument("--force", action="store_true", help="Recompute even if inputs are unchanged")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    db = MongoClient(os.getenv("MONGO_URI"))[os.getenv("MONGO_DB")]
+    ensure_indexes(db)
+    run(db, days=args.days, weather_path=args.weather, force=args.force)
@@ -0,0 +1,241 @@
+"""
+Multi-process inference fed through a shared-memory frame ring.
+
+One process cannot saturate a many-core node (GIL, per-process torch thread
+pools), and pickling decoded frames between processes would cost more than
+it saves. Instead the decoder writes each frame straight into a slot of a
+`multiprocessing.shared_memory` ring; N inference processes, each with its
+own model, a fixed torch thread count and (where supported) its own CPU
+cores, view the slot in place and send back only the small detections
+array. Results are re-ordered so the caller sees frames in decode order.
+If the caller stops iterating early, the job's queued frames are dropped
+rather than run against a ring that is about to be reused.
+
+INFERENCE_PROCS=0/1 keeps inference in the worker process (serial_frames).
+"""
+import multiprocessing as mp
+import os
+import queue
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+import inference
+from tiling import build_detector
+
+
+def cv2_reader(cap: cv2.VideoCapture):
+    """A read_into(buf) -> bool function decoding straight into `buf`."""
+
+    def read_into(buf: np.ndarray) -> bool:
+        ok, img = cap.read(buf)
+        if ok and img is not buf:
+            # Decoder could not reuse the buffer (size changed mid-stream)
+            np.copyto(buf, img)
+        return ok
+
+    return read_into
+
+
+def serial_frames(read_into, shape: tuple, detect):
+    """In-process counterpart of InferencePool.run(), reusing one frame buffer."""
+    buf = np.empty(shape, dtype=np.uint8)
+    while read_into(buf):
+        yield buf, detect(buf)
+
+
+@contextmanager
+def detect_frames(reader, model, spec: dict, pool: "InferencePool" = None):
+    """
+    Iterator of (frame, detections) for every frame of `reader` (a
+    VideoReader), run on `pool` when given and in this process with `model`
+    otherwise. Leaving the block, also on failure, drops the pool's queued
+    frames and closes the reader, so the next job starts clean.
+    """
+    frames = None
+    try:
+        if pool:
+            frames = pool.run(reader.read_into, reader.shape, spec)
+        else:
+            frames = serial_frames(
+                reader.read_into, reader.shape, build_detector(model, spec, reader.out_w, reader.out_h)
+            )
+        yield frames
+    finally:
+        if frames is not None:
+            frames.close()
+        reader.close()
+
+
+def _inference_process(index, model_path, threads, tasks, results, current):
+    import torch
+
+    torch.set_num_threads(threads)
+    if hasattr(os, "sched_setaffinity"):
+        cores = sorted(os.sched_getaffinity(0))
+        if len(cores) >= threads * (index + 1):
+            os.sched_setaffinity(0, cores[index * threads:(index + 1) * threads])
+
+    model = inference.load_model(model_path)
+    shm = None
+    ring = None
+    job_key = None
+    detect = None
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        seq, key, shm_name, n_slots, shape, slot, spec = task
+        if key != current.value.decode():
+            # Abandoned job: nobody waits for the result and the slot may
+            # already hold another job's frame
+            continue
+
+        try:
+            if shm is None or shm.name != shm_name:
+                if shm is not None:
+                    ring = None
+                    shm.close()
+                    shm = None
+                shm = shared_memory.SharedMemory(name=shm_name)
+                ring = np.ndarray((n_slots, *shape), dtype=np.uint8, buffer=shm.buf)
+            if key != job_key:
+                detect = build_detector(model, spec, shape[1], shape[0])
+                job_key = key
+            results.put((key, seq, slot, detect(ring[slot]), None))
+        except Exception as e:
+            results.put((key, seq, slot, None, str(e)))
+
+    if shm is not None:
+        ring = None
+        shm.close()
+
+
+class InferencePool:
+    def __init__(self, model_path: str, processes: int, threads: int = None, slots: int = None):
+        self.processes = processes
+        self.threads = threads or max(1, (os.cpu_count() or 1) // processes)
+        self.n_slots = slots or 2 * processes
+        self.shm = None
+        self.shape = None
+
+        # fork: the worker scripts run their job loop at import time, so
+        # spawn/forkserver children (which re-import __main__) can't be used
+        ctx = mp.get_context("fork")
+        self.tasks = ctx.Queue()
+        self.results = ctx.Queue()
+        # Key of the job being run; children skip tasks of any other job
+        self.current = ctx.Array("c", 32)
+
+        # A cold export runs torch forward passes. Do it in a throwaway child
+        # first: the children then load the cached artifact instead of all
+        # exporting at once, and the caller, which must create the pool before
+        # loading its own model, never forks with live OpenMP thread pools
+        warm = ctx.Process(target=inference.load_model, args=(model_path,))
+        warm.start()
+        warm.join()
+
+        self.procs = [
+            ctx.Process(
+                target=_inference_process,
+                args=(i, model_path, self.threads, self.tasks, self.results, self.current),
+                daemon=True,
+            )
+            for i in range(processes)
+        ]
+        for p in self.procs:
+            p.start()
+        print(f"Inference pool: {processes} processes x {self.threads} threads, {self.n_slots} slots")
+
+    def _ensure_ring(self, shape: tuple):
+        if self.shape == shape:
+            return
+        self._release_ring()
+        size = self.n_slots * int(np.prod(shape))
+        self.shm = shared_memory.SharedMemory(create=True, size=size)
+        self.ring = np.ndarray((self.n_slots, *shape), dtype=np.uint8, buffer=self.shm.buf)
+        self.shape = shape
+
+    def _release_ring(self):
+        if self.shm is not None:
+            self.ring = None
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+            self.shape = None
+
+    def _result(self):
+        while True:
+            try:
+                return self.results.get(timeout=1)
+            except queue.Empty:
+                if not all(p.is_alive() for p in self.procs):
+                    raise RuntimeError("Inference process died")
+
+    def run(self, read_into, shape: tuple, spec: dict):
+        """
+        Decode with read_into(slot) -> bool and yield (frame, detections) in order.
+
+        `frame` is a view into the ring and is only valid until the next
+        iteration; draw or copy it before advancing. Close the generator (or
+        let it finish) before starting another run.
+        """
+        self._ensure_ring(shape)
+        key = uuid.uuid4().hex
+        self.current.value = key.encode()
+        free = deque(range(self.n_slots))
+        done = {}
+        next_seq = next_out = 0
+        eof = False
+
+        try:
+            while True:
+                while free and not eof:
+                    slot = free.popleft()
+                    if not read_into(self.ring[slot]):
+                        eof = True
+                        free.appendleft(slot)
+                        break
+                    self.tasks.put((next_seq, key, self.shm.name, self.n_slots, shape, slot, spec))
+                    next_seq += 1
+
+                if eof and next_out == next_seq:
+                    return
+
+                while next_out not in done:
+                    res_key, seq, slot, detections, error = self._result()
+                    if res_key != key:
+                        # Left over from an abandoned job
+                        continue
+                    if error:
+                        raise RuntimeError(f"Inference failed on frame {seq}: {error}")
+                    done[seq] = (slot, detections)
+
+                slot, detections = done.pop(next_out)
+                yield self.ring[slot], detections
+                free.append(slot)
+                next_out += 1
+        finally:
+            # Stopped early (error, or the caller closed the generator): make
+            # the children skip this job's remaining frames
+            self.current.value = b""
+            self._drain_tasks()
+
+    def _drain_tasks(self):
+        try:
+            while True:
+                self.tasks.get_nowait()
+        except queue.Empty:
+            pass
+
+    def close(self):
+        for _ in self.procs:
+            self.tasks.put(None)
+        for p in self.procs:
+            p.join(timeout=5)
+        self._release_ring()
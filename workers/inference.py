@@ -0,0 +1,153 @@
+"""
+Inference backends for the YOLO workers.
+
+INFERENCE_BACKEND selects how a model runs:
+    torch     PyTorch eager execution (default)
+    onnx      ONNX Runtime on CPU
+    openvino  OpenVINO on CPU
+
+INFERENCE_INT8=1 additionally quantizes the exported model to INT8
+(dynamic quantization for ONNX, calibrated post-training quantization for
+OpenVINO). OpenVINO calibration needs INT8_CALIBRATION_DATA, a dataset
+yaml of images the model actually sees: there is no default, because
+calibrating the road-damage model on COCO skews its activation ranges.
+
+Exports have dynamic input shapes, so per-job inference sizes and batched
+tiles run on the exported model just like on PyTorch.
+
+Exports happen once: artifacts are cached under MODEL_CACHE_DIR in a
+directory keyed by the hash of the source .pt file, so worker restarts and
+other workers sharing the cache reuse them. If an export fails the worker
+falls back to PyTorch rather than refusing to start.
+"""
+import hashlib
+import os
+import shutil
+
+import numpy as np
+from ultralytics import YOLO
+from ultralytics.utils.plotting import Annotator, colors
+
+BACKENDS = ("torch", "onnx", "openvino")
+CACHE_DIR = os.getenv(
+    "MODEL_CACHE_DIR",
+    os.path.join(os.path.dirname(__file__), "models", ".cache"),
+)
+DEFAULT_IMGSZ = 640
+
+
+def model_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def _artifact(directory: str):
+    for entry in sorted(os.listdir(directory)):
+        if entry.endswith(".onnx") or entry.endswith("_openvino_model"):
+            return os.path.join(directory, entry)
+    return None
+
+
+def _quantize_onnx(onnx_path: str) -> str:
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    int8_path = onnx_path[: -len(".onnx")] + "-int8.onnx"
+    quantize_dynamic(onnx_path, int8_path, weight_type=QuantType.QUInt8)
+    os.remove(onnx_path)
+    return int8_path
+
+
+def export_model(path: str, backend: str, int8: bool = False, imgsz: int = DEFAULT_IMGSZ) -> str:
+    """Export `path` for `backend` (or reuse the cached export) and return the artifact path."""
+    if backend not in BACKENDS or backend == "torch":
+        raise ValueError(f"Cannot export to backend: {backend}")
+
+    calibration = os.getenv("INT8_CALIBRATION_DATA")
+    if backend == "openvino" and int8 and not calibration:
+        raise ValueError("OpenVINO INT8 needs INT8_CALIBRATION_DATA (a dataset yaml)")
+
+    name = os.path.splitext(os.path.basename(path))[0]
+    tag = f"{name}-{model_hash(path)}-{backend}-{imgsz}-dynamic" + ("-int8" if int8 else "")
+    target_dir = os.path.join(CACHE_DIR, tag)
+    if os.path.isdir(target_dir):
+        cached = _artifact(target_dir)
+        if cached:
+            return cached
+
+    # Export from a private scratch copy, then rename into place, so workers
+    # sharing the cache never see a half-written artifact
+    tmp_dir = f"{target_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    src = shutil.copy(path, os.path.join(tmp_dir, os.path.basename(path)))
+
+    if backend == "onnx":
+        exported = YOLO(src).export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True)
+        if int8:
+            exported = _quantize_onnx(exported)
+    else:
+        kwargs = {"format": "openvino", "imgsz": imgsz, "dynamic": True}
+        if int8:
+            kwargs.update(int8=True, data=calibration)
+        exported = YOLO(src).export(**kwargs)
+    os.remove(src)
+
+    try:
+        os.rename(tmp_dir, target_dir)
+    except OSError:
+        # Another worker finished the same export first; use theirs
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return os.path.join(target_dir, os.path.basename(str(exported).rstrip("/")))
+
+
+def load_model(path: str, backend: str = None, int8: bool = None, imgsz: int = DEFAULT_IMGSZ) -> YOLO:
+    """Load a YOLO model on the configured backend."""
+    if not os.path.exists(path):
+        raise RuntimeError(f"Model not found: {path}")
+
+    backend = backend or os.getenv("INFERENCE_BACKEND", "torch")
+    if int8 is None:
+        int8 = os.getenv("INFERENCE_INT8", "0") == "1"
+    if backend not in BACKENDS:
+        raise RuntimeError(f"Unknown INFERENCE_BACKEND: {backend}")
+    if backend == "openvino" and int8 and not os.getenv("INT8_CALIBRATION_DATA"):
+        # Refuse to start rather than fall back: the setting is plainly wrong
+        raise RuntimeError("INFERENCE_INT8=1 on openvino needs INT8_CALIBRATION_DATA")
+
+    if backend == "torch":
+        print(f"Loaded {os.path.basename(path)} (torch)")
+        return YOLO(path)
+
+    try:
+        artifact = export_model(path, backend, int8=int8, imgsz=imgsz)
+    except Exception as e:
+        print(f"Export to {backend} failed, falling back to torch:", e)
+        return YOLO(path)
+
+    print(f"Loaded {os.path.basename(path)} ({backend}{', int8' if int8 else ''}) from {artifact}")
+    return YOLO(artifact, task="detect")
+
+
+def detect(model: YOLO, images, **kwargs) -> list:
+    """
+    Run `model` on one image or a list of images.
+
+    Returns one [N, 6] float array per image with rows
+    [x1, y1, x2, y2, conf, cls], in the coordinates of that image.
+    """
+    single = not isinstance(images, list)
+    results = model(images, verbose=False, **kwargs)
+    detections = [res.boxes.data.cpu().numpy().astype(np.float32) for res in results]
+    return detections[0] if single else detections
+
+
+def draw(frame: np.ndarray, detections: np.ndarray, names: dict) -> np.ndarray:
+    """Annotate a copy of `frame` the same way ultralytics Results.plot() does."""
+    annotator = Annotator(frame.copy())
+    for x1, y1, x2, y2, conf, cls_id in detections:
+        cls_id = int(cls_id)
+        annotator.box_label((x1, y1, x2, y2), f"{names[cls_id]} {conf:.2f}", color=colors(cls_id, True))
+    return annotator.result()
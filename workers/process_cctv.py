@@ -1,14 +1,28 @@
 import os
+import sys
 import json
 import math
 import redis
 import boto3
-import cv2
 import numpy as np
-from datetime import datetime, timezone
 from pymongo import MongoClient
-from ultralytics import YOLO
+
+# Shared modules (common/): copied next to this file in the image, a
+# sibling directory locally
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "common"))
+import schema
+
 from sort import Sort
+import inference
+import queues
+import road_segments
+import traffic
+from defects import parse_track
+from frame_pool import InferencePool, detect_frames
+from roi import normalize_polygon
+from tiling import decode_size
+from status import StatusWriter
+from video_reader import VideoReader
 from dotenv import load_dotenv
 
 load_dotenv(os.path.join(os.path.dirname(__file__), "..", ".env"))
@@ -26,7 +40,10 @@ GROUP = "vehicle_count_workers"
 MODEL_PATH = os.path.join(os.path.dirname(__file__), "models", "yolov8n.pt")
 INPUT_TMP = "/tmp/input.mp4"
 COUNT_LINE_Y = 350
+DEFAULT_IMGSZ = int(os.getenv("CCTV_IMGSZ", inference.DEFAULT_IMGSZ))
 PROGRESS_EVERY_N_FRAMES = 50
+# Pickups of one job before it is failed (covers workers killed mid-job)
+MAX_ATTEMPTS = 3
 
 CLASS_MAP = {
     "motorcycle": "Small",
@@ -36,29 +53,14 @@ CLASS_MAP = {
     "truck": "Heavy",
 }
 
-# =========================================================
-# SEVERITY
-# =========================================================
-def compute_severity(totals: dict) -> str:
-    score = totals["small"] + 2 * totals["medium"] + 3 * totals["heavy"]
-    if score < 50:
-        return "Good"
-    elif score < 120:
-        return "Moderate"
-    elif score < 250:
-        return "Poor"
-    return "Critical"
-
 # =========================================================
 # REDIS
 # =========================================================
 r = redis.Redis.from_url(os.getenv("REDIS_URL"), decode_responses=False)
-try:
-    r.xgroup_create(JOB_STREAM, GROUP, id="0", mkstream=True)
-except redis.exceptions.ResponseError:
-    pass
+queues.ensure_groups(r, JOB_STREAM, GROUP)
 
 CONSUMER = os.getenv("HOSTNAME", "vehicle-worker-1")
+scheduler = queues.LaneScheduler(r, JOB_STREAM, GROUP, CONSUMER)
 
 # =========================================================
 # MONGO
@@ -66,6 +68,11 @@ CONSUMER = os.getenv("HOSTNAME", "vehicle-worker-1")
 mongo = MongoClient(os.getenv("MONGO_URI"))
 db = mongo[os.getenv("MONGO_DB")]
 videos = db.videos
+schema.ensure_indexes(videos)
+status = StatusWriter(videos)
+segments_store = db.road_segments
+road_segments.ensure_indexes(segments_store)
+traffic.ensure_collections(db)
 
 # =========================================================
 # S3
@@ -81,7 +88,14 @@ BUCKET = os.getenv("S3_BUCKET")
 # =========================================================
 # ML
 # =========================================================
-model = YOLO(MODEL_PATH)
+# Multi-process inference over a shared-memory frame ring (see frame_pool.py),
+# forked before this process loads its own model
+INFERENCE_PROCS = int(os.getenv("INFERENCE_PROCS", "0"))
+pool = None
+if INFERENCE_PROCS > 1:
+    pool = InferencePool(MODEL_PATH, INFERENCE_PROCS, threads=int(os.getenv("INFERENCE_THREADS", "0")) or None)
+
+model = inference.load_model(MODEL_PATH)
 tracker = Sort()
 
 print("Vehicle-count worker ready")
@@ -90,135 +104,163 @@ print("Vehicle-count worker ready")
 # WORK LOOP
 # =========================================================
 while True:
-    streams = r.xreadgroup(
-        groupname=GROUP,
-        consumername=CONSUMER,
-        streams={JOB_STREAM: ">"},
-        count=1,
-        block=5000,
-    )
-
-    if not streams:
+    job = scheduler.next_job(block=5000)
+
+    if not job:
+        continue
+
+    lane, message_id, data = job
+    video_id = data[b"video_id"].decode()
+    gps_coords = json.loads(data[b"gps_coords"].decode())
+    print(f"Received job for video_id={video_id} at {gps_coords}")
+    doc = videos.find_one({"_id": video_id})
+    if not doc or doc.get("status") in schema.TERMINAL_STATUSES:
+        queues.ack(r, lane, GROUP, message_id, data)
+        continue
+
+    # Counted at pickup: a clip that kills the worker (out of memory, a
+    # crash in decode) comes back through XAUTOCLAIM, at most this often
+    attempts = doc.get("attempts", 0) + 1
+    if attempts > MAX_ATTEMPTS:
+        error = f"worker lost the job {MAX_ATTEMPTS} times (crash or out of memory)"
+        status.update(video_id, {"status": schema.FAILED, "error": error}, flush=True)
+        queues.publish_event(r, EVENT_STREAM, {"video_id": video_id, "status": schema.FAILED, "error": error})
+        queues.ack(r, lane, GROUP, message_id, data)
         continue
 
-    for _, messages in streams:
-        for message_id, data in messages:
-            video_id = data[b"video_id"].decode()
-            gps_coords = json.loads(data[b"gps_coords"].decode())
-            print(f"Received job for video_id={video_id} at {gps_coords}")
-            doc = videos.find_one({"video_id": video_id})
-            if not doc or doc.get("status") == "PROCESSED":
-                r.xack(JOB_STREAM, GROUP, message_id)
-                continue
-
-            # ---------- START ----------
-            r.xadd(EVENT_STREAM, {
-                "video_id": video_id,
-                "status": "PROCESSING",
-                "timestamp": datetime.now(timezone.utc).isoformat(),
-            })
-
-            try:
-                s3.download_file(BUCKET, f"{video_id}.mp4", INPUT_TMP)
-                cap = cv2.VideoCapture(INPUT_TMP)
-                if not cap.isOpened():
-                    raise RuntimeError("Cannot open video")
-
-                counts = {"Small": 0, "Medium": 0, "Heavy": 0}
-                class_counts = {k: 0 for k in CLASS_MAP}
-                counted_ids = set()
-                id_to_type = {}
-                id_to_class = {}
-
-                frame_idx = 0
-
-                while True:
-                    ret, frame = cap.read()
-                    if not ret:
-                        break
-
-                    frame_idx += 1
-                    results = model(frame, conf=0.3, verbose=False)[0]
-
-                    detections = []
-                    current_objects = []
-
-                    for box in results.boxes:
-                        cls_name = model.names[int(box.cls[0])]
-                        if cls_name not in CLASS_MAP:
-                            continue
-
-                        x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                        detections.append([x1, y1, x2, y2, box.conf.item()])
-
-                        cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
-                        current_objects.append(((cx, cy), CLASS_MAP[cls_name], cls_name))
-
-                    tracks = tracker.update(
-                        np.array(detections) if detections else np.empty((0, 5))
-                    )
-
-                    for x1, y1, x2, y2, tid in tracks:
-                        tid = int(tid)
-                        ty = (y1 + y2) / 2
-
-                        for (dcx, dcy), vtype, vclass in current_objects:
-                            if math.hypot((x1 + x2)/2 - dcx, ty - dcy) < 50:
-                                id_to_type[tid] = vtype
-                                id_to_class[tid] = vclass
-
-                        if tid not in counted_ids and ty > COUNT_LINE_Y and tid in id_to_type:
-                            counted_ids.add(tid)
-                            counts[id_to_type[tid]] += 1
-                            class_counts[id_to_class[tid]] += 1
-
-                    # ---------- PROGRESS ----------
-                    if frame_idx % PROGRESS_EVERY_N_FRAMES == 0:
-                        r.xadd(EVENT_STREAM, {
-                            "video_id": video_id,
-                            "status": "RUNNING",
-                            "frame": frame_idx,
-                        })
-
-                cap.release()
-
-                vehicle_totals = {
-                    "small": counts["Small"],
-                    "medium": counts["Medium"],
-                    "heavy": counts["Heavy"],
-                    "total": sum(counts.values()),
-                }
-                print(f"Finished processing video_id={video_id}, totals={vehicle_totals}")
-                severity = compute_severity(vehicle_totals)
-
-                videos.update_one(
-                    {"video_id": video_id},
-                    {
-                        "$set": {
-                            "status": "PROCESSED",
-                            "vehicle_totals": vehicle_totals,
-                            "class_counts": class_counts,
-                            "severity": severity,
-                            "result_key": f"{video_id}.json",
-                            "updated_at": datetime.now(timezone.utc),
-                        }
-                    },
+    # ---------- START ----------
+    status.update(video_id, {"status": schema.PROCESSING, "attempts": attempts}, flush=True)
+    queues.publish_event(r, EVENT_STREAM, {
+        "video_id": video_id,
+        "status": schema.PROCESSING,
+    })
+    heartbeat = scheduler.keepalive(lane, message_id)
+
+    try:
+        s3.download_file(BUCKET, f"{video_id}.mp4", INPUT_TMP)
+        probe = VideoReader(INPUT_TMP)
+        w, h = probe.width, probe.height
+        probe.close()
+
+        # Per-camera road area and inference size, stored with the CCTV doc.
+        # Nothing is drawn, so frames are decoded straight at inference size;
+        # detections are scaled back to full-frame coordinates for counting
+        spec = {
+            "roi": normalize_polygon(doc.get("roi"), w, h),
+            "imgsz": doc.get("inference_imgsz") or DEFAULT_IMGSZ,
+            "conf": 0.3,
+            "source_size": [w, h],
+        }
+        reader = VideoReader(INPUT_TMP, size=decode_size(spec, w, h))
+        with detect_frames(reader, model, spec, pool) as frames:
+            counts = {"Small": 0, "Medium": 0, "Heavy": 0}
+            class_counts = {k: 0 for k in CLASS_MAP}
+            counted_ids = set()
+            id_to_type = {}
+            id_to_class = {}
+            crossings = []  # (frame_idx, vehicle type, class) per counted vehicle
+
+            frame_idx = 0
+
+            for frame, results in frames:
+                frame_idx += 1
+
+                detections = []
+                current_objects = []
+
+                for x1, y1, x2, y2, conf, cls_id in results:
+                    cls_name = model.names[int(cls_id)]
+                    if cls_name not in CLASS_MAP:
+                        continue
+
+                    detections.append([x1, y1, x2, y2, conf])
+
+                    cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+                    current_objects.append(((cx, cy), CLASS_MAP[cls_name], cls_name))
+
+                tracks = tracker.update(
+                    np.array(detections) if detections else np.empty((0, 5))
                 )
 
-                # ---------- DONE ----------
-                r.xadd(EVENT_STREAM, {
-                    "video_id": video_id,
-                    "status": "DONE",
-                    "vehicle_totals": json.dumps(vehicle_totals),
-                    "severity": severity,
-                })
-
-                r.xack(JOB_STREAM, GROUP, message_id)
-
-            except Exception as e:
-                r.xadd(EVENT_STREAM, {
-                    "video_id": video_id,
-                    "status": "FAILED",
-                    "error": str(e),
-                })
-                r.xack(JOB_STREAM, GROUP, message_id)
+                for x1, y1, x2, y2, tid in tracks:
+                    tid = int(tid)
+                    ty = (y1 + y2) / 2
+
+                    for (dcx, dcy), vtype, vclass in current_objects:
+                        if math.hypot((x1 + x2)/2 - dcx, ty - dcy) < 50:
+                            id_to_type[tid] = vtype
+                            id_to_class[tid] = vclass
+
+                    if tid not in counted_ids and ty > COUNT_LINE_Y and tid in id_to_type:
+                        counted_ids.add(tid)
+                        counts[id_to_type[tid]] += 1
+                        class_counts[id_to_class[tid]] += 1
+                        crossings.append((frame_idx, id_to_type[tid].lower(), id_to_class[tid]))
+
+                # ---------- PROGRESS ----------
+                if frame_idx % PROGRESS_EVERY_N_FRAMES == 0:
+                    status.update(video_id, {"progress": {"frame": frame_idx}})
+                    queues.publish_event(r, EVENT_STREAM, {
+                        "video_id": video_id,
+                        "status": "RUNNING",
+                        "frame": frame_idx,
+                    })
+
+        vehicle_totals = {
+            "small": counts["Small"],
+            "medium": counts["Medium"],
+            "heavy": counts["Heavy"],
+            "total": sum(counts.values()),
+        }
+        print(f"Finished processing video_id={video_id}, totals={vehicle_totals}")
+        # Scored as a rate over the clip's duration (see traffic.py)
+        severity = traffic.compute_severity(vehicle_totals, hours=frame_idx / reader.fps / 3600)
+
+        # Fold this clip into the camera's minute samples and rollups and its
+        # road segment; both are idempotent per clip, so a retry after a
+        # failure here completes them without counting vehicles twice
+        points, _ = parse_track(gps_coords)
+        camera_id = doc.get("camera_id") or (
+            "gh:" + road_segments.geohash(points[0][0], points[0][1], 9) if points is not None else video_id
+        )
+        traffic.record(
+            db,
+            traffic.minute_samples(
+                crossings, doc.get("recorded_at") or doc["created_at"], reader.fps, frame_idx, camera_id, video_id
+            ),
+            camera_id,
+            {"type": "Point", "coordinates": [points[0][1], points[0][0]]} if points is not None else None,
+        )
+        if points is not None:
+            road_segments.apply_traffic(segments_store, points[0][0], points[0][1], vehicle_totals, video_id)
+
+        # ---------- DONE ----------
+        status.update(video_id, {
+            "status": schema.DONE,
+            "frames": frame_idx,
+            "progress": {"frame": frame_idx},
+            "vehicle_totals": vehicle_totals,
+            "class_counts": class_counts,
+            "severity": severity,
+            "result_key": f"{video_id}.json",
+        }, flush=True)
+        queues.publish_event(r, EVENT_STREAM, {
+            "video_id": video_id,
+            "status": schema.DONE,
+            "vehicle_totals": json.dumps(vehicle_totals),
+            "severity": severity,
+        })
+
+        queues.ack(r, lane, GROUP, message_id, data)
+
+    except Exception as e:
+        status.update(video_id, {"status": schema.FAILED, "error": str(e)}, flush=True)
+        queues.publish_event(r, EVENT_STREAM, {
+            "video_id": video_id,
+            "status": schema.FAILED,
+            "error": str(e),
+        })
+        queues.ack(r, lane, GROUP, message_id, data)
+
+    finally:
+        heartbeat.stop()
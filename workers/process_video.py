@@ -1,39 +1,74 @@
 import os
+import sys
+import json
+import shutil
 import redis
 import boto3
-import cv2
-import datetime
 from pymongo import MongoClient
-from ultralytics import YOLO
 from collections import defaultdict
 from dotenv import load_dotenv
 
+# Shared modules (common/): copied next to this file in the image, a
+# sibling directory locally
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "common"))
+import schema
+
+import defects
+import hls
+import inference
+import queues
+import road_segments
+from frame_pool import InferencePool, detect_frames
+from roi import normalize_polygon
+from tiling import decode_size
+from status import StatusWriter
+from video_reader import VideoReader
+
 load_dotenv(os.path.join(os.path.dirname(__file__), "..", ".env"))
 
 # ---------- CONFIG ----------
 MODEL_PATH = os.path.join(os.path.dirname(__file__), "models", "YOLOv8_Small_RDD.pt")
 INPUT_TMP = "/tmp/input.mp4"
 OUTPUT_TMP = "/tmp/output.mp4"
+SEGMENTS_TMP = "/tmp/segments"
 RESULT_PREFIX = "results/"
 STREAM_NAME = "video_jobs"
+EVENT_STREAM = "video_events"
 GROUP_NAME = "workers"
+CONF = 0.25
+# Annotated output is cut into HLS segments of about this length. Each
+# segment is uploaded as soon as it is done and doubles as a checkpoint, so
+# a restarted or retried job resumes from the last segment, not frame 0
+SEGMENT_SECONDS = float(os.getenv("SEGMENT_SECONDS", "4"))
+# The playlist lists every segment so far; re-upload it every N segments
+# (and once at the end) rather than after every segment
+PLAYLIST_EVERY_N_SEGMENTS = int(os.getenv("PLAYLIST_EVERY_N_SEGMENTS", "5"))
+MAX_ATTEMPTS = 3
+PROGRESS_EVERY_N_FRAMES = 50
+# Road area assumed for sliced inference when a job sets no ROI: the lower
+# part of a forward-facing dash-cam frame (normalised x, y)
+DEFAULT_ROAD_ROI = [[0, 0.45], [1, 0.45], [1, 1], [0, 1]]
 # ----------------------------
 
 # ---------- REDIS ----------
 r = redis.Redis.from_url(os.getenv("REDIS_URL"))
 
-# Create consumer group (safe if exists)
-try:
-    r.xgroup_create(STREAM_NAME, GROUP_NAME, id="0", mkstream=True)
-except redis.exceptions.ResponseError:
-    pass
+# Create consumer groups for every priority lane (safe if exists)
+queues.ensure_groups(r, STREAM_NAME, GROUP_NAME)
 
 consumer = os.getenv("HOSTNAME", "worker-1")
+scheduler = queues.LaneScheduler(r, STREAM_NAME, GROUP_NAME, consumer)
 
 # ---------- MONGO ----------
 mongo = MongoClient(os.getenv("MONGO_URI"))
 db = mongo[os.getenv("MONGO_DB")]
 videos = db.videos
+schema.ensure_indexes(videos)
+status = StatusWriter(videos)
+known_defects = db.defects
+defects.ensure_indexes(known_defects)
+segments_store = db.road_segments
+road_segments.ensure_indexes(segments_store)
 
 # ---------- MINIO / S3 ----------
 s3 = boto3.client(
@@ -44,10 +79,18 @@ s3 = boto3.client(
 )
 
 # ---------- YOLO ----------
-if not os.path.exists(MODEL_PATH):
-    raise RuntimeError(f"Model not found: {MODEL_PATH}")
-
-model = YOLO(MODEL_PATH)
+# INFERENCE_PROCS > 1 runs inference in that many processes fed through a
+# shared-memory frame ring (see frame_pool.py). They are forked before this
+# process loads (and possibly exports) its own model, so no torch thread
+# pools exist yet at fork time
+INFERENCE_PROCS = int(os.getenv("INFERENCE_PROCS", "0"))
+pool = None
+if INFERENCE_PROCS > 1:
+    pool = InferencePool(MODEL_PATH, INFERENCE_PROCS, threads=int(os.getenv("INFERENCE_THREADS", "0")) or None)
+
+# Loaded once per worker process and reused across jobs; INFERENCE_BACKEND
+# selects torch / onnx / openvino (see inference.py)
+model = inference.load_model(MODEL_PATH)
 
 # # GPU (comment this line if CPU-only)
 # try:
@@ -56,133 +99,286 @@ model = YOLO(MODEL_PATH)
 # except Exception:
 #     print("YOLO running on CPU")
 
+
+# ---------- CHECKPOINTS / SEGMENTS ----------
+def segment_key(video_id: str, idx: int) -> str:
+    return f"{RESULT_PREFIX}{video_id}/{idx:05d}.ts"
+
+
+def playlist_key(video_id: str) -> str:
+    return f"{RESULT_PREFIX}{video_id}/index.m3u8"
+
+
+def upload_playlist(video_id: str, segments: list, finished: bool):
+    s3.put_object(
+        Bucket=os.getenv("S3_BUCKET"),
+        Key=playlist_key(video_id),
+        Body=hls.playlist(segments, finished).encode(),
+        ContentType="application/vnd.apple.mpegurl",
+    )
+
+
+def save_checkpoint(video_id, frame_count, frame_detection_stats, damage, new_segments, annotate):
+    # Durable before the next segment starts, so a resume never skips one.
+    # Segments finished since the last checkpoint are appended, not rewritten;
+    # unannotated jobs have no playlist to point at
+    status.update(video_id, {
+        "checkpoint.frame": frame_count,
+        "checkpoint.frame_detection_stats": dict(frame_detection_stats),
+        "checkpoint.instances": damage.state(),
+        **({"playlist_key": playlist_key(video_id)} if annotate else {}),
+    }, push={"checkpoint.segments": new_segments}, flush=True)
+
+
+def fetch_segments(segments: list) -> list:
+    """Local paths of all segments, downloading those written before a resume."""
+    paths = []
+    for seg in segments:
+        local = os.path.join(SEGMENTS_TMP, os.path.basename(seg["key"]))
+        if not os.path.exists(local):
+            s3.download_file(os.getenv("S3_BUCKET"), seg["key"], local)
+        paths.append(local)
+    return paths
+
+
 print("Worker ready")
 
 # ========== WORKER LOOP ==========
 while True:
     print("Waiting for jobs...")
-    streams = r.xreadgroup(
-        groupname=GROUP_NAME,
-        consumername=consumer,
-        streams={STREAM_NAME: ">"},
-        count=1,
-        block=5000
-    )
+    job = scheduler.next_job(block=5000)
+
+    # Block timeout returns None; nothing to do
+    if not job:
+        continue
+
+    lane, message_id, data = job
+    video_id = data[b"video_id"].decode()
+    input_key = f"{video_id}.mp4"
+    output_key = f"{RESULT_PREFIX}{video_id}_detected.mp4"
+
+    # ---------- IDEMPOTENCY CHECK ----------
+    doc = videos.find_one({"_id": video_id})
+    if not doc:
+        queues.ack(r, lane, GROUP_NAME, message_id, data)
+        print(f"[{video_id}] no such video → skipped")
+        continue
+    if doc.get("status") in schema.TERMINAL_STATUSES:
+        queues.ack(r, lane, GROUP_NAME, message_id, data)
+        print(f"[{video_id}] already {doc['status']} → skipped")
+        continue
 
-    # Block timeout returns None or []; avoid crash on None
-    if not streams:
+    # Attempts are counted at pickup, so a job that kills the worker outright
+    # (out of memory, a crash in decode) and comes back through XAUTOCLAIM
+    # is capped like one that raises
+    attempts = doc.get("attempts", 0) + 1
+    if attempts > MAX_ATTEMPTS:
+        error = doc.get("error") or f"worker lost the job {MAX_ATTEMPTS} times (crash or out of memory)"
+        print(f"[{video_id}] FAILED: {error}")
+        status.update(video_id, {"status": schema.FAILED, "error": error}, flush=True)
+        queues.publish_event(r, EVENT_STREAM, {"video_id": video_id, "status": schema.FAILED, "error": error})
+        queues.ack(r, lane, GROUP_NAME, message_id, data)
         continue
 
-    for _, messages in streams:
-        for message_id, data in messages:
-            video_id = data[b"video_id"].decode()
-            input_key = f"{video_id}.mp4"
-            output_key = f"{RESULT_PREFIX}{video_id}_detected.mp4"
-
-            # ---------- IDEMPOTENCY CHECK ----------
-            doc = videos.find_one({"_id": video_id})
-            if doc:
-                if doc.get("status") == "DONE":
-                    r.xack(STREAM_NAME, GROUP_NAME, message_id)
-                    print(f"[{video_id}] already DONE → skipped")
-                    continue
-                if doc.get("status") == "FAILED":
-                    r.xack(STREAM_NAME, GROUP_NAME, message_id)
-                    print(f"[{video_id}] already FAILED → skipped")
-                    continue
-
-            print(f"[{video_id}] processing")
-
-            try:
-                print(f"[{video_id}] marking PROCESSING")
-                # Mark PROCESSING
-                videos.update_one(
-                    {"_id": video_id},
-                    {"$set": {
-                        "status": "PROCESSING",
-                        "updated_at": datetime.datetime.utcnow()
-                    }},
-                    upsert=True
-                )
-
-                # Download input video
-                print(f"[{video_id}] downloading from S3")
-                s3.download_file(os.getenv("S3_BUCKET"), input_key, INPUT_TMP)
-
-                cap = cv2.VideoCapture(INPUT_TMP)
-                if not cap.isOpened():
-                    raise RuntimeError("Cannot open video")
-
-                w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-                h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-                fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
-
-                out = cv2.VideoWriter(
-                    OUTPUT_TMP,
-                    cv2.VideoWriter_fourcc(*"mp4v"),
-                    fps,
-                    (w, h)
-                )
-
-                detection_stats = defaultdict(int)
-                frame_count = 0
-
-                # ---------- FRAME LOOP ----------
-                while True:
-                    success, frame = cap.read()
-                    if not success:
-                        break
-
-                    results = model(frame, conf=0.25, verbose=False)
-
-                    for box in results[0].boxes:
-                        cls_id = int(box.cls[0])
-                        cls_name = model.names[cls_id]
-                        detection_stats[cls_name] += 1
-
-                    annotated = results[0].plot()
-                    out.write(annotated)
-                    frame_count += 1
-
-                cap.release()
-                out.release()
-
-                # Upload result video
-                s3.upload_file(
-                    OUTPUT_TMP,
-                    os.getenv("S3_BUCKET"),
-                    output_key
-                )
-
-                # Save final result
-                videos.update_one(
-                    {"_id": video_id},
-                    {"$set": {
-                        "status": "DONE",
-                        "frames": frame_count,
-                        "detection_stats": dict(detection_stats),
-                        "result_key": output_key,
-                        "updated_at": datetime.datetime.utcnow()
-                    }}
-                )
-
-                # ACK MESSAGE
-                r.xack(STREAM_NAME, GROUP_NAME, message_id)
-                print(f"[{video_id}] DONE ({frame_count} frames)")
-
-            except Exception as e:
-                print(f"[{video_id}] FAILED:", e)
-
-                videos.update_one(
-                    {"_id": video_id},
-                    {"$set": {
-                        "status": "FAILED",
-                        "error": str(e),
-                        "updated_at": datetime.datetime.utcnow()
-                    }}
-                )
-                # ACK so this message is not re-delivered forever
-                r.xack(STREAM_NAME, GROUP_NAME, message_id)
+    print(f"[{video_id}] processing ({lane}, attempt {attempts})")
+    checkpoint = doc.get("checkpoint") or {}
+    out = None
+    heartbeat = scheduler.keepalive(lane, message_id)
+
+    try:
+        print(f"[{video_id}] marking PROCESSING")
+        # Mark PROCESSING
+        status.update(video_id, {"status": schema.PROCESSING, "attempts": attempts}, flush=True)
+        queues.publish_event(r, EVENT_STREAM, {"video_id": video_id, "status": schema.PROCESSING})
+
+        # Download input video
+        print(f"[{video_id}] downloading from S3")
+        s3.download_file(os.getenv("S3_BUCKET"), input_key, INPUT_TMP)
+
+        # Per-job inference mode: plain, ROI-cropped, or sliced into tiles
+        tiling = doc.get("tiling")
+        roi_polygon = doc.get("roi")
+        annotate = doc.get("annotate", True)
+        time_range = doc.get("time_range") or {}
+
+        probe = VideoReader(INPUT_TMP)
+        w, h, fps = probe.width, probe.height, probe.fps
+        total_frames = probe.frame_count
+        probe.close()
+
+        spec = {
+            "roi": normalize_polygon(roi_polygon or (DEFAULT_ROAD_ROI if tiling else None), w, h),
+            "tiling": tiling,
+            "conf": CONF,
+            "source_size": [w, h],
+        }
+
+        # Raw per-frame box counts, plus tracked per-defect instances,
+        # restored from the last checkpoint when resuming
+        frame_detection_stats = defaultdict(int, checkpoint.get("frame_detection_stats", {}))
+        damage = defects.DamageTracker()
+        damage.restore(checkpoint.get("instances", []))
+        segments = list(checkpoint.get("segments", []))
+        checkpointed_segments = len(segments)
+        frame_count = checkpoint.get("frame") or round((time_range.get("start") or 0) * fps)
+        if checkpoint.get("frame"):
+            print(f"[{video_id}] resuming from frame {frame_count}")
+
+        shutil.rmtree(SEGMENTS_TMP, ignore_errors=True)
+        os.makedirs(SEGMENTS_TMP)
+        frames_per_segment = max(1, round(fps * SEGMENT_SECONDS))
+
+        def open_segment():
+            path = os.path.join(SEGMENTS_TMP, os.path.basename(segment_key(video_id, len(segments))))
+            return hls.SegmentEncoder(path, w, h, fps, start_seconds=frame_count / fps)
+
+        def finish_segment(encoder, finished=False):
+            encoder.close()
+            key = segment_key(video_id, len(segments))
+            s3.upload_file(encoder.path, os.getenv("S3_BUCKET"), key)
+            segments.append({"key": key, "duration": round(encoder.duration, 3)})
+            # From the first segment on, so the playlist exists once a job has output
+            if finished or (len(segments) - 1) % PLAYLIST_EVERY_N_SEGMENTS == 0:
+                upload_playlist(video_id, segments, finished)
+
+        out = open_segment() if annotate else None
+        since_checkpoint = 0
+
+        # Full-resolution frames only when they are drawn into the output;
+        # otherwise decode straight to inference size
+        reader = VideoReader(
+            INPUT_TMP,
+            size=None if annotate else decode_size(spec, w, h),
+            start_frame=frame_count,
+            end_seconds=time_range.get("end"),
+        )
+
+        with detect_frames(reader, model, spec, pool) as frames:
+            # ---------- FRAME LOOP ----------
+            for frame, detections in frames:
+                for cls_id in detections[:, 5]:
+                    cls_name = model.names[int(cls_id)]
+                    frame_detection_stats[cls_name] += 1
+                damage.update(frame_count, detections)
+
+                if annotate:
+                    out.write(inference.draw(frame, detections, model.names))
+                frame_count += 1
+                since_checkpoint += 1
+
+                # ---------- PROGRESS ----------
+                if frame_count % PROGRESS_EVERY_N_FRAMES == 0:
+                    # Coalesced by the status writer; at most one write per flush interval
+                    status.update(video_id, {"progress": {"frame": frame_count, "total_frames": total_frames}})
+                    queues.publish_event(r, EVENT_STREAM, {
+                        "video_id": video_id,
+                        "status": "RUNNING",
+                        "frame": frame_count,
+                        "total_frames": total_frames,
+                    })
+
+                # ---------- SEGMENT + CHECKPOINT ----------
+                if since_checkpoint >= frames_per_segment:
+                    if annotate:
+                        finish_segment(out)
+                        out = open_segment()
+                    save_checkpoint(
+                        video_id, frame_count, frame_detection_stats, damage, segments[checkpointed_segments:],
+                        annotate,
+                    )
+                    checkpointed_segments = len(segments)
+                    since_checkpoint = 0
+
+        if annotate:
+            if out.frames:
+                finish_segment(out, finished=True)
+            else:
+                out.abort()
+                upload_playlist(video_id, segments, finished=True)
+            out = None
+
+            # Join the segments into a fast-start MP4 for download
+            hls.concat_to_mp4(fetch_segments(segments), os.path.join(SEGMENTS_TMP, "segments.txt"), OUTPUT_TMP)
+            s3.upload_file(
+                OUTPUT_TMP,
+                os.getenv("S3_BUCKET"),
+                output_key
+            )
+
+        # One instance per tracked defect, geotagged along the GPS track and
+        # merged with defects already known from earlier patrols
+        instances = defects.summarize(
+            damage.confirmed(), model.names, doc.get("gps_coords"), fps, frame_count
+        )
+        detection_stats = defaultdict(int)
+        for inst in instances:
+            detection_stats[inst["class"]] += 1
+        # Both are idempotent per video, so a retry after a failure here (or
+        # a crash) completes the merge without counting anything twice
+        merge = defects.merge_into(known_defects, instances, video_id)
+        road_segments.apply_defects(segments_store, merge["created"], video_id)
+
+        # Save final result
+        status.update(video_id, {
+            "status": schema.DONE,
+            "frames": frame_count,
+            "progress": {"frame": frame_count, "total_frames": frame_count},
+            "detection_stats": dict(detection_stats),
+            "frame_detection_stats": dict(frame_detection_stats),
+            "damage_instances": instances,
+            "defects_new": merge["new"],
+            "defects_merged": merge["merged"],
+            "result_key": output_key if annotate else None,
+            "playlist_key": playlist_key(video_id) if annotate else None,
+        }, unset=("checkpoint",), flush=True)
+
+        queues.publish_event(r, EVENT_STREAM, {
+            "video_id": video_id,
+            "status": schema.DONE,
+            "frames": frame_count,
+            "detection_stats": json.dumps(dict(detection_stats)),
+        })
+
+        # ACK MESSAGE
+        queues.ack(r, lane, GROUP_NAME, message_id, data)
+        print(f"[{video_id}] DONE ({frame_count} frames, {len(instances)} defects)")
+
+    except Exception as e:
+        if attempts < MAX_ATTEMPTS:
+            # Keep the checkpoint; the retry (on any worker) resumes from it
+            print(f"[{video_id}] attempt {attempts} failed, retrying:", e)
+            status.update(video_id, {
+                "status": schema.RETRYING,
+                "error": str(e),
+            }, flush=True)
+            queues.publish_event(r, EVENT_STREAM, {
+                "video_id": video_id,
+                "status": schema.RETRYING,
+                "attempt": attempts,
+                "error": str(e),
+            })
+            queues.requeue(r, lane, GROUP_NAME, message_id, data)
+            continue
+
+        print(f"[{video_id}] FAILED:", e)
+
+        status.update(video_id, {
+            "status": schema.FAILED,
+            "error": str(e),
+        }, flush=True)
+        queues.publish_event(r, EVENT_STREAM, {
+            "video_id": video_id,
+            "status": schema.FAILED,
+            "error": str(e),
+        })
+        # ACK so this message is not re-delivered forever
+        queues.ack(r, lane, GROUP_NAME, message_id, data)
+
+    finally:
+        heartbeat.stop()
+        # A failed job must not leave its ffmpeg process or partial segment behind
+        if out is not None:
+            out.abort()
 
 
 print("Worker stopped")
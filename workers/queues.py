@@ -0,0 +1,178 @@
+"""
+Priority lanes for the Redis job streams.
+
+Every job stream is split into three lanes (high / normal / bulk, see
+common/lanes.py). Workers consume the lanes with smooth weighted
+round-robin, so a large bulk backfill only ever gets its share of the worker
+and an urgent job waits for at most a couple of jobs ahead of it.
+"""
+import os
+import threading
+from datetime import datetime, timezone
+
+import redis
+
+from lanes import PRIORITIES, lane_name, lane_names
+
+DEFAULT_WEIGHTS = {"high": 6, "normal": 3, "bulk": 1}
+# A job whose consumer has not heartbeated for this long is presumed dead
+# (crashed / redeployed worker) and is reclaimed by another worker
+CLAIM_IDLE_MS = int(os.getenv("QUEUE_CLAIM_IDLE_MS", str(10 * 60 * 1000)))
+HEARTBEAT_SECONDS = 60
+# Progress event streams are trimmed (approximately) to this many entries
+EVENT_STREAM_MAXLEN = int(os.getenv("EVENT_STREAM_MAXLEN", "10000"))
+
+
+def parse_weights(spec: str) -> dict:
+    """Parse "high=6,normal=3,bulk=1" (missing lanes keep their default)."""
+    weights = dict(DEFAULT_WEIGHTS)
+    for part in filter(None, (spec or "").split(",")):
+        name, _, value = part.partition("=")
+        name = name.strip()
+        if name in weights:
+            weights[name] = max(1, int(value))
+    return weights
+
+
+def ensure_groups(r: redis.Redis, stream: str, group: str):
+    # Create consumer groups (safe if they exist)
+    for lane in lane_names(stream):
+        try:
+            r.xgroup_create(lane, group, id="0", mkstream=True)
+        except redis.exceptions.ResponseError:
+            pass
+
+
+def ack(r: redis.Redis, lane: str, group: str, message_id, data: dict):
+    """ACK a job and release its enqueue-time dedup key, if any."""
+    r.xack(lane, group, message_id)
+    dedup_key = data.get(b"dedup_key")
+    if dedup_key:
+        r.delete(dedup_key)
+
+
+def requeue(r: redis.Redis, lane: str, group: str, message_id, data: dict):
+    """Put a job back at the end of its lane for a retry (keeps its dedup key)."""
+    pipe = r.pipeline()
+    pipe.xadd(lane, data)
+    pipe.xack(lane, group, message_id)
+    pipe.execute()
+
+
+def publish_event(r: redis.Redis, stream: str, fields: dict):
+    """Publish a progress event on a capped stream (the API fans these out over SSE)."""
+    fields = {"timestamp": datetime.now(timezone.utc).isoformat(), **fields}
+    r.xadd(stream, fields, maxlen=EVENT_STREAM_MAXLEN, approximate=True)
+
+
+class LaneScheduler:
+    """
+    Picks the next job across the priority lanes of one stream.
+
+    Each call advances a smooth weighted round-robin and tries the chosen lane
+    first, falling back to the others in priority order when it is empty. When
+    every lane is empty it blocks on each lane in turn for a slice of `block`.
+    Every read claims at most one message, so the worker never holds jobs it
+    is not working on (those would go idle, be reclaimed by another worker
+    and run twice). Jobs left pending by a dead consumer are reclaimed before
+    new ones are read.
+    """
+
+    def __init__(self, r: redis.Redis, stream: str, group: str, consumer: str, weights: dict = None):
+        self.r = r
+        self.group = group
+        self.consumer = consumer
+        self.lanes = lane_names(stream)
+        weights = weights or parse_weights(os.getenv("QUEUE_WEIGHTS", ""))
+        self.weights = {lane_name(stream, p): weights[p] for p in PRIORITIES}
+        self.current = {lane: 0 for lane in self.lanes}
+
+    def _order(self) -> list:
+        total = sum(self.weights.values())
+        for lane in self.lanes:
+            self.current[lane] += self.weights[lane]
+        best = max(self.lanes, key=self.current.get)
+        self.current[best] -= total
+        return [best] + [lane for lane in self.lanes if lane != best]
+
+    def next_job(self, block: int = 5000):
+        """Return (lane, message_id, data) or None on timeout."""
+        for lane in self.lanes:
+            stale = self._claim_stale(lane)
+            if stale:
+                return stale
+
+        order = self._order()
+        for lane in order:
+            job = self._read(lane)
+            if job:
+                return job
+
+        # A job arriving on another lane waits at most one slice
+        block_slice = max(1, block // len(order))
+        for lane in order:
+            job = self._read(lane, block_slice)
+            if job:
+                return job
+        return None
+
+    def _read(self, lane: str, block: int = None):
+        streams = self.r.xreadgroup(
+            groupname=self.group,
+            consumername=self.consumer,
+            streams={lane: ">"},
+            count=1,
+            block=block,
+        )
+        if not streams:
+            return None
+        _, messages = streams[0]
+        message_id, data = messages[0]
+        return lane, message_id, data
+
+    def _claim_stale(self, lane: str):
+        resp = self.r.xautoclaim(
+            lane, self.group, self.consumer, min_idle_time=CLAIM_IDLE_MS, start_id="0-0", count=1
+        )
+        for message_id, data in resp[1]:
+            # Entries deleted from the stream come back without data
+            if data:
+                print(f"Reclaimed stale job {message_id} on {lane}")
+                return lane, message_id, data
+        return None
+
+    def keepalive(self, lane: str, message_id) -> "Heartbeat":
+        """Start heartbeating a claimed job; stop() the result when done with it."""
+        return Heartbeat(self.r, lane, self.group, self.consumer, message_id)
+
+
+class Heartbeat:
+    """
+    Resets a claimed job's idle time every HEARTBEAT_SECONDS from a
+    background thread, so other workers don't reclaim it during long
+    blocking steps (download, concat, result upload, merges). Dies with
+    the worker process, so a crashed worker's job still goes stale.
+    """
+
+    def __init__(self, r: redis.Redis, lane: str, group: str, consumer: str, message_id,
+                 interval: float = HEARTBEAT_SECONDS):
+        self.r = r
+        self.lane = lane
+        self.group = group
+        self.consumer = consumer
+        self.message_id = message_id
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.r.xclaim(self.lane, self.group, self.consumer, 0, [self.message_id], justid=True)
+            except redis.exceptions.RedisError as e:
+                print(f"Heartbeat for {self.message_id} on {self.lane} failed: {e}")
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
@@ -0,0 +1,196 @@
+"""
+Road-segment aggregates: per-stretch damage, traffic load and risk.
+
+Road stretches are fixed geohash cells (ROAD_SEGMENT_PRECISION, default 7,
+roughly 150 m x 150 m). Every finished job folds its results into the
+`road_segments` collection incrementally:
+
+    video jobs  new defects per class and a weighted damage score
+    CCTV jobs   vehicle counts and their equivalent axle load
+
+Each update is a single atomic pipeline update that adds the increments
+and recomputes risk_score / risk_level from the new totals, so map views
+read precomputed rows instead of re-aggregating raw jobs. Segments
+remember the last RECENT_JOBS jobs folded into them, so a retried job is
+never counted twice.
+"""
+import os
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import numpy as np
+from pymongo import ASCENDING, GEOSPHERE
+from pymongo.errors import DuplicateKeyError
+
+PRECISION = int(os.getenv("ROAD_SEGMENT_PRECISION", "7"))
+
+# Relative damage weights by RDD class; matched on lower-cased class name
+DAMAGE_WEIGHTS = [
+    (("pothole", "d40"), 3.0),
+    (("alligator", "d20"), 2.0),
+]
+DEFAULT_DAMAGE_WEIGHT = 1.0
+
+# Equivalent standard axle loads per vehicle: pavement wear grows with
+# roughly the fourth power of axle load, so heavy vehicles dominate
+AXLE_LOAD = {"small": 0.0005, "medium": 0.002, "heavy": 1.5}
+
+# risk_score = damage_score * (1 + LOAD_FACTOR * ln(1 + axle_load))
+LOAD_FACTOR = 0.1
+# Job ids kept per segment to skip re-applied jobs
+RECENT_JOBS = 50
+RISK_LEVELS = [(5, "Good"), (15, "Moderate"), (40, "Poor")]  # above: Critical
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+# ---------- GEOHASH ----------
+
+def geohash(lat: float, lon: float, precision: int = PRECISION) -> str:
+    lat_lo, lat_hi, lon_lo, lon_hi = -90.0, 90.0, -180.0, 180.0
+    chars, bits, ch, even = [], 0, 0, True
+    while len(chars) < precision:
+        if even:
+            mid = (lon_lo + lon_hi) / 2
+            if lon >= mid:
+                ch, lon_lo = (ch << 1) | 1, mid
+            else:
+                ch, lon_hi = ch << 1, mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                ch, lat_lo = (ch << 1) | 1, mid
+            else:
+                ch, lat_hi = ch << 1, mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[ch])
+            bits, ch = 0, 0
+    return "".join(chars)
+
+
+def geohash_bounds(code: str) -> tuple:
+    """(min_lat, min_lon, max_lat, max_lon) of a geohash cell."""
+    lat_lo, lat_hi, lon_lo, lon_hi = -90.0, 90.0, -180.0, 180.0
+    even = True
+    for c in code:
+        v = _BASE32.index(c)
+        for shift in range(4, -1, -1):
+            bit = (v >> shift) & 1
+            if even:
+                mid = (lon_lo + lon_hi) / 2
+                lon_lo, lon_hi = (mid, lon_hi) if bit else (lon_lo, mid)
+            else:
+                mid = (lat_lo + lat_hi) / 2
+                lat_lo, lat_hi = (mid, lat_hi) if bit else (lat_lo, mid)
+            even = not even
+    return lat_lo, lon_lo, lat_hi, lon_hi
+
+
+def geohash_int(code: str) -> int:
+    """A geohash string as the integer of its 5 * len(code) bits."""
+    v = 0
+    for c in code:
+        v = (v << 5) | _BASE32.index(c)
+    return v
+
+
+def geohash_codes(lat, lon, precision: int = PRECISION) -> np.ndarray:
+    """Vectorized geohash_int(geohash(lat, lon)) over coordinate arrays."""
+    n = 5 * precision
+    lon_bits, lat_bits = (n + 1) // 2, n // 2
+    lon_q = np.clip(((np.asarray(lon, dtype=np.float64) + 180) / 360 * (1 << lon_bits)).astype(np.int64),
+                    0, (1 << lon_bits) - 1)
+    lat_q = np.clip(((np.asarray(lat, dtype=np.float64) + 90) / 180 * (1 << lat_bits)).astype(np.int64),
+                    0, (1 << lat_bits) - 1)
+
+    # Interleave the quantized coordinates, longitude bit first
+    code = np.zeros(lon_q.shape, dtype=np.int64)
+    for i in range(n):
+        if i % 2 == 0:
+            lon_bits -= 1
+            bit = (lon_q >> lon_bits) & 1
+        else:
+            lat_bits -= 1
+            bit = (lat_q >> lat_bits) & 1
+        code = (code << 1) | bit
+    return code
+
+
+# ---------- UPDATES ----------
+
+def ensure_indexes(segments):
+    segments.create_index([("center", GEOSPHERE)])
+    segments.create_index([("risk_level", ASCENDING), ("risk_score", ASCENDING)])
+
+
+def damage_weight(cls_name: str) -> float:
+    name = cls_name.lower()
+    for keys, weight in DAMAGE_WEIGHTS:
+        if any(k in name for k in keys):
+            return weight
+    return DEFAULT_DAMAGE_WEIGHT
+
+
+def _field(name: str) -> str:
+    # Class names become embedded field names; keep them path-safe
+    return name.replace(".", "_").replace("$", "_")
+
+
+def _add(path: str, n):
+    return {"$add": [{"$ifNull": [f"${path}", 0]}, n]}
+
+
+def _apply(segments, code: str, incs: dict, extra: dict, job_id: str):
+    min_lat, min_lon, max_lat, max_lon = geohash_bounds(code)
+    now = datetime.now(timezone.utc)
+    load = {"$ifNull": ["$axle_load", 0]}
+    score = {"$multiply": [
+        {"$ifNull": ["$damage_score", 0]},
+        {"$add": [1, {"$multiply": [LOAD_FACTOR, {"$ln": {"$add": [1, load]}}]}]},
+    ]}
+    branches = [{"case": {"$lt": ["$risk_score", limit]}, "then": level} for limit, level in RISK_LEVELS]
+
+    applied = {"$concatArrays": [{"$ifNull": ["$applied_jobs", []]}, [job_id]]}
+    try:
+        segments.update_one(
+            {"_id": code, "applied_jobs": {"$ne": job_id}},
+            [
+                {"$set": {
+                    **{path: _add(path, n) for path, n in incs.items()},
+                    **extra,
+                    "applied_jobs": {"$slice": [applied, -RECENT_JOBS]},
+                    "center": {"type": "Point", "coordinates": [(min_lon + max_lon) / 2, (min_lat + max_lat) / 2]},
+                    "created_at": {"$ifNull": ["$created_at", now]},
+                    "updated_at": now,
+                }},
+                {"$set": {"risk_score": score}},
+                {"$set": {"risk_level": {"$switch": {"branches": branches, "default": "Critical"}}}},
+            ],
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        # The segment exists and already has this job: the filter missed and
+        # the upsert collided with it
+        pass
+
+
+def apply_defects(segments, new_defects: list, job_id: str):
+    """Fold a job's newly found defects ([{"class", "lat", "lon"}]) into their segments."""
+    per_segment = defaultdict(lambda: defaultdict(float))
+    for d in new_defects:
+        incs = per_segment[geohash(d["lat"], d["lon"])]
+        incs[f"damage.{_field(d['class'])}"] += 1
+        incs["damage_score"] += damage_weight(d["class"])
+
+    now = datetime.now(timezone.utc)
+    for code, incs in per_segment.items():
+        _apply(segments, code, incs, {"last_patrol_at": now}, job_id)
+
+
+def apply_traffic(segments, lat: float, lon: float, vehicle_totals: dict, job_id: str):
+    """Fold one CCTV job's vehicle totals into the camera's segment."""
+    incs = {f"traffic.{k}": vehicle_totals.get(k, 0) for k in AXLE_LOAD}
+    incs["axle_load"] = sum(AXLE_LOAD[k] * vehicle_totals.get(k, 0) for k in AXLE_LOAD)
+    _apply(segments, geohash(lat, lon), incs, {"last_traffic_at": datetime.now(timezone.utc)}, job_id)
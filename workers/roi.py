@@ -0,0 +1,68 @@
+"""
+Region-of-interest cropping for inference.
+
+A region is a polygon of [x, y] points, either in pixels or normalised to
+0..1 of the frame size. Inference runs on the polygon's bounding rectangle
+with everything outside the polygon blacked out, and detections are shifted
+back into full-frame coordinates afterwards, so tracking and counting work
+exactly as they would on the whole frame.
+"""
+import cv2
+import numpy as np
+
+
+class RegionOfInterest:
+    def __init__(self, polygon, frame_w: int, frame_h: int):
+        self.frame_w = frame_w
+        self.frame_h = frame_h
+
+        if not polygon:
+            # No ROI configured: the whole frame
+            self.x0, self.y0, self.x1, self.y1 = 0, 0, frame_w, frame_h
+            self.mask = None
+            return
+
+        pts = np.asarray(polygon, dtype=np.float64).reshape(-1, 2)
+        if pts.max() <= 1.0:
+            pts = pts * [frame_w, frame_h]
+        pts = np.round(pts).astype(np.int32)
+        pts[:, 0] = np.clip(pts[:, 0], 0, frame_w - 1)
+        pts[:, 1] = np.clip(pts[:, 1], 0, frame_h - 1)
+
+        x, y, w, h = cv2.boundingRect(pts)
+        self.x0, self.y0, self.x1, self.y1 = x, y, x + w, y + h
+
+        mask = np.zeros((h, w), dtype=np.uint8)
+        cv2.fillPoly(mask, [pts - [x, y]], 255)
+        # Axis-aligned rectangles need no masking, just the crop
+        self.mask = None if mask.all() else mask
+
+    @property
+    def is_full_frame(self) -> bool:
+        return self.mask is None and (self.x0, self.y0, self.x1, self.y1) == (0, 0, self.frame_w, self.frame_h)
+
+    def crop(self, frame: np.ndarray) -> np.ndarray:
+        if self.is_full_frame:
+            return frame
+        crop = frame[self.y0:self.y1, self.x0:self.x1]
+        if self.mask is not None:
+            crop = cv2.bitwise_and(crop, crop, mask=self.mask)
+        return crop
+
+    def to_frame(self, detections: np.ndarray) -> np.ndarray:
+        """Shift [N, 4+] xyxy detections from crop to full-frame coordinates."""
+        if len(detections) and (self.x0 or self.y0):
+            detections = detections.copy()
+            detections[:, [0, 2]] += self.x0
+            detections[:, [1, 3]] += self.y0
+        return detections
+
+
+def normalize_polygon(polygon, frame_w: int, frame_h: int):
+    """Express a pixel polygon as 0..1 of the frame, so it survives resizing."""
+    if not polygon:
+        return polygon
+    pts = np.asarray(polygon, dtype=np.float64).reshape(-1, 2)
+    if pts.max() <= 1.0:
+        return polygon
+    return (pts / [frame_w, frame_h]).tolist()
@@ -0,0 +1,64 @@
+"""
+Batched job-status writes.
+
+Progress and status updates used to cost one Mongo round trip each.
+StatusWriter keeps the latest fields per job and writes every pending job
+with one unordered bulk_write once STATUS_FLUSH_SECONDS have passed or
+max_pending jobs are waiting. Updates that must be durable before the
+worker moves on (terminal statuses, checkpoints) pass flush=True, which
+also writes everything queued before them. Growing arrays are appended
+with `push` rather than rewritten in full.
+"""
+import os
+import time
+from datetime import datetime, timezone
+
+from pymongo import UpdateOne
+
+FLUSH_SECONDS = float(os.getenv("STATUS_FLUSH_SECONDS", "2"))
+
+
+class StatusWriter:
+    def __init__(self, collection, interval: float = FLUSH_SECONDS, max_pending: int = 100):
+        self.collection = collection
+        self.interval = interval
+        self.max_pending = max_pending
+        self.pending = {}
+        self.last_flush = time.monotonic()
+
+    def update(
+        self, video_id: str, fields: dict = None, unset: tuple = (), push: dict = None, flush: bool = False
+    ):
+        """
+        Queue `$set: fields` / `$unset: unset` for a job; later fields win.
+        `push` maps array fields to lists of items to append.
+        """
+        upd = self.pending.setdefault(video_id, {"$set": {}, "$unset": {}, "$push": {}})
+        for name in unset:
+            # Also drops queued writes to fields nested under `name`
+            for op in ("$set", "$push"):
+                for key in [k for k in upd[op] if k == name or k.startswith(name + ".")]:
+                    del upd[op][key]
+            upd["$unset"][name] = ""
+        for name, items in (push or {}).items():
+            if items:
+                upd["$push"].setdefault(name, {"$each": []})["$each"].extend(items)
+        for name, value in (fields or {}).items():
+            upd["$unset"].pop(name, None)
+            upd["$set"][name] = value
+        upd["$set"]["updated_at"] = datetime.now(timezone.utc)
+
+        if flush or len(self.pending) >= self.max_pending or time.monotonic() - self.last_flush >= self.interval:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.collection.bulk_write(
+                [
+                    UpdateOne({"_id": video_id}, {op: v for op, v in upd.items() if v})
+                    for video_id, upd in self.pending.items()
+                ],
+                ordered=False,
+            )
+            self.pending = {}
+        self.last_flush = time.monotonic()
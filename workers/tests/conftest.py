@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The worker modules are flat scripts with common/ copied next to them in
+# the image; import them the same way
+HERE = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(1, os.path.join(HERE, "..", "..", "common"))
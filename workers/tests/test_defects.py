@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+from pymongo import InsertOne
+
+mongomock = pytest.importorskip("mongomock")
+pytest.importorskip("filterpy")
+
+import defects  # noqa: E402
+
+
+class GeoCollection:
+    """mongomock collection plus the $geoWithin box query merge_into uses."""
+
+    def __init__(self):
+        self.collection = mongomock.MongoClient().db.defects
+
+    def find(self, query, projection=None):
+        query = dict(query)
+        (west, south), (east, _), (_, north) = query.pop("location")["$geoWithin"]["$geometry"]["coordinates"][0][:3]
+        for doc in self.collection.find(query):
+            lon, lat = doc["location"]["coordinates"]
+            if west <= lon <= east and south <= lat <= north:
+                yield doc
+
+    def bulk_write(self, ops, ordered=True):
+        # mongomock's bulk API lags pymongo's; apply the ops one by one
+        for op in ops:
+            if isinstance(op, InsertOne):
+                self.collection.insert_one(op._doc)
+            else:
+                self.collection.update_one(op._filter, op._doc, upsert=op._upsert)
+
+
+def _instance(cls, lat, lon, hits=5, area=100.0):
+    return {"class": cls, "lat": lat, "lon": lon, "hits": hits, "max_area_px": area,
+            "first_frame": 0, "last_frame": hits}
+
+
+# ~1.1 m of latitude
+STEP = 1e-5
+
+
+def test_tracker_confirms_a_defect_seen_over_several_frames():
+    tracker = defects.DamageTracker(min_hits=3)
+    box = np.array([[100, 100, 150, 150, 0.9, 0]], dtype=np.float32)
+    for frame in range(5):
+        tracker.update(frame, box)
+    tracker.update(5, np.empty((0, 6), dtype=np.float32))
+
+    confirmed = tracker.confirmed()
+    assert len(confirmed) == 1
+    assert confirmed[0]["class_id"] == 0 and confirmed[0]["hits"] >= 3
+
+
+def test_tracker_state_round_trips_through_a_checkpoint():
+    tracker = defects.DamageTracker()
+    tracker.restore([{"class_id": 1, "first_frame": 0, "last_frame": 9, "hits": 9, "max_area_px": 10.0}])
+    assert [i["hits"] for i in tracker.state()] == [9]
+
+
+def test_cluster_joins_same_class_instances_within_the_radius():
+    clusters = defects._cluster([
+        _instance("pothole", 12.0, 77.0, hits=5),
+        _instance("pothole", 12.0 + 2 * STEP, 77.0, hits=3),
+        _instance("crack", 12.0, 77.0, hits=2),
+        _instance("pothole", 12.0 + 100 * STEP, 77.0, hits=1),
+    ], radius_m=5)
+    assert sorted((c["class"], c["hits"]) for c in clusters) == [("crack", 2), ("pothole", 1), ("pothole", 8)]
+
+
+def test_merge_creates_then_merges_sightings():
+    store = GeoCollection()
+    first = defects.merge_into(store, [_instance("pothole", 12.0, 77.0)], "v1")
+    assert (first["new"], first["merged"]) == (1, 0)
+
+    second = defects.merge_into(store, [_instance("pothole", 12.0 + STEP, 77.0, area=150.0)], "v2")
+    assert (second["new"], second["merged"], second["created"]) == (0, 1, [])
+
+    doc = store.collection.find_one()
+    assert doc["observations"] == 2 and doc["max_area_px"] == 150.0
+    assert [s["video_id"] for s in doc["sightings"]] == ["v1", "v2"]
+
+
+def test_merge_is_idempotent_per_video():
+    store = GeoCollection()
+    instances = [_instance("pothole", 12.0, 77.0), _instance("crack", 12.001, 77.0)]
+    defects.merge_into(store, [_instance("pothole", 12.0, 77.0)], "old")
+
+    first = defects.merge_into(store, instances, "v1")
+    retry = defects.merge_into(store, instances, "v1")
+
+    # The retry reports the same outcome and writes nothing
+    assert (retry["new"], retry["merged"], retry["created"]) == (first["new"], first["merged"], first["created"])
+    assert store.collection.count_documents({}) == 2
+    assert store.collection.find_one({"class": "pothole"})["observations"] == 2
+
+
+def test_merge_skips_instances_without_a_location():
+    store = GeoCollection()
+    result = defects.merge_into(store, [_instance("pothole", None, None)], "v1")
+    assert result == {"new": 0, "merged": 0, "created": []}
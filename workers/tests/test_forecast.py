@@ -0,0 +1,75 @@
+from datetime import date
+
+import numpy as np
+
+import forecast
+from road_segments import geohash, geohash_codes, geohash_int
+
+DAYS = 5
+
+
+def _defects(lat, lon, classes=("pothole", "crack")):
+    return {
+        "class": np.array(classes, dtype=object),
+        "lat": np.array(lat, dtype=np.float64),
+        "lon": np.array(lon, dtype=np.float64),
+        "area": np.full(len(classes), 100.0, dtype=np.float32),
+    }
+
+
+def _no_segments():
+    return {"code": np.empty(0, dtype=np.int64), "damage_score": np.empty(0), "axle_load": np.empty(0)}
+
+
+def _stub_weather():
+    return forecast.load_weather(None, DAYS, date(2026, 5, 1))[:2]
+
+
+def test_geohash_codes_matches_scalar_geohash():
+    rng = np.random.default_rng(0)
+    lat = rng.uniform(-90, 90, 200)
+    lon = rng.uniform(-180, 180, 200)
+    for precision in (5, 7):
+        codes = geohash_codes(lat, lon, precision)
+        assert codes.tolist() == [geohash_int(geohash(a, o, precision)) for a, o in zip(lat, lon)]
+
+
+def test_geohash_codes_clamps_the_upper_edges():
+    code = geohash_codes(np.array([90.0]), np.array([180.0]), 5)[0]
+    assert code == (1 << 25) - 1
+
+
+def test_forecast_without_road_segments():
+    cell_codes, weather = _stub_weather()
+    per_defect, per_segment = forecast.forecast(_defects([12.0, 12.1], [77.0, 77.1]), _no_segments(),
+                                                cell_codes, weather)
+    assert per_defect["growth_by_day"].shape == (2, DAYS)
+    # Potholes grow faster than the default class
+    assert per_defect["growth_factor"][0] > per_defect["growth_factor"][1] > 1
+    assert len(per_segment["risk_score"]) == 0
+
+
+def test_forecast_adds_load_and_growth_to_the_defects_segment():
+    cell_codes, weather = _stub_weather()
+    lat, lon = [12.0, 12.0], [77.0, 77.0]
+    code = geohash_int(geohash(lat[0], lon[0]))
+    segments = {
+        "code": np.array([code], dtype=np.int64),
+        "damage_score": np.array([1.0]),
+        "axle_load": np.array([1000.0]),
+    }
+    loaded, per_segment = forecast.forecast(_defects(lat, lon), segments, cell_codes, weather)
+    unloaded, _ = forecast.forecast(_defects(lat, lon), _no_segments(), cell_codes, weather)
+
+    # Heavy traffic on the segment speeds up growth
+    assert (loaded["growth_factor"] > unloaded["growth_factor"]).all()
+    assert per_segment["damage_score"][0] > 1.0
+    assert per_segment["risk_score"][0] > per_segment["damage_score"][0]
+
+
+def test_weather_rows_are_placed_by_date():
+    rows = [{"date": "2026-05-03", "rain_mm": 10, "freeze_thaw": 1}, {"date": "2026-04-30", "rain_mm": 99}]
+    series = forecast._series(rows, DAYS, date(2026, 5, 1))
+    assert series[0].tolist() == [forecast.STUB_RAIN_MM, forecast.STUB_RAIN_MM, 10, forecast.STUB_RAIN_MM,
+                                  forecast.STUB_RAIN_MM]
+    assert series[1].tolist() == [0, 0, 1, 0, 0]
@@ -0,0 +1,20 @@
+from hls import playlist
+
+SEGMENTS = [
+    {"key": "results/v1/00000.ts", "duration": 4.0},
+    {"key": "results/v1/00001.ts", "duration": 4.2},
+]
+
+
+def test_playlist_in_progress_is_an_open_event_playlist():
+    text = playlist(SEGMENTS, finished=False)
+    assert "#EXT-X-PLAYLIST-TYPE:EVENT" in text
+    assert "#EXT-X-ENDLIST" not in text
+    # Target duration is the longest segment, rounded up
+    assert "#EXT-X-TARGETDURATION:5" in text
+
+
+def test_playlist_lists_segments_relative_to_the_playlist():
+    lines = playlist(SEGMENTS, finished=True).splitlines()
+    assert lines[-5:] == ["#EXTINF:4.000,", "00000.ts", "#EXTINF:4.200,", "00001.ts", "#EXT-X-ENDLIST"]
+    assert "#EXT-X-PLAYLIST-TYPE:VOD" in lines
@@ -0,0 +1,78 @@
+import time
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+import queues  # noqa: E402
+
+STREAM, GROUP = "jobs", "workers"
+
+
+@pytest.fixture
+def r():
+    r = fakeredis.FakeRedis()
+    queues.ensure_groups(r, STREAM, GROUP)
+    return r
+
+
+def _enqueue(r, priority, n):
+    for i in range(n):
+        r.xadd(queues.lane_name(STREAM, priority), {"video_id": f"{priority}-{i}"})
+
+
+def test_weighted_round_robin_shares_the_worker_between_lanes(r):
+    for p in queues.PRIORITIES:
+        _enqueue(r, p, 20)
+    scheduler = queues.LaneScheduler(r, STREAM, GROUP, "w1", weights={"high": 6, "normal": 3, "bulk": 1})
+
+    picked = [scheduler.next_job(block=10)[0] for _ in range(10)]
+    assert picked.count("jobs:high") == 6
+    assert picked.count("jobs") == 3
+    assert picked.count("jobs:bulk") == 1
+
+
+def test_empty_lanes_fall_back_and_time_out(r):
+    _enqueue(r, "bulk", 1)
+    scheduler = queues.LaneScheduler(r, STREAM, GROUP, "w1")
+    lane, _, data = scheduler.next_job(block=10)
+    assert (lane, data[b"video_id"]) == ("jobs:bulk", b"bulk-0")
+    assert scheduler.next_job(block=30) is None
+
+
+def test_each_read_claims_exactly_one_job(r):
+    for p in queues.PRIORITIES:
+        _enqueue(r, p, 1)
+    scheduler = queues.LaneScheduler(r, STREAM, GROUP, "w1")
+    scheduler.next_job(block=10)
+    pending = sum(r.xpending(lane, GROUP)["pending"] for lane in queues.lane_names(STREAM))
+    assert pending == 1
+
+
+def test_stale_jobs_are_reclaimed_by_another_worker(r, monkeypatch):
+    _enqueue(r, "normal", 1)
+    lane, message_id, _ = queues.LaneScheduler(r, STREAM, GROUP, "dead").next_job(block=10)
+
+    monkeypatch.setattr(queues, "CLAIM_IDLE_MS", 0)
+    reclaimed = queues.LaneScheduler(r, STREAM, GROUP, "w2").next_job(block=10)
+    assert reclaimed[:2] == (lane, message_id)
+
+
+def test_heartbeat_keeps_the_job_from_going_idle(r):
+    _enqueue(r, "normal", 1)
+    lane, message_id, _ = queues.LaneScheduler(r, STREAM, GROUP, "w1").next_job(block=10)
+    time.sleep(0.3)
+    heartbeat = queues.Heartbeat(r, lane, GROUP, "w1", message_id, interval=0.05)
+    time.sleep(0.2)
+    heartbeat.stop()
+    idle = r.xpending_range(lane, GROUP, min=message_id, max=message_id, count=1)[0]["time_since_delivered"]
+    assert idle < 250
+
+
+def test_ack_releases_the_dedup_key(r):
+    r.set("jobs:queued:abc", "v1")
+    r.xadd(STREAM, {"video_id": "v1", "dedup_key": "jobs:queued:abc"})
+    lane, message_id, data = queues.LaneScheduler(r, STREAM, GROUP, "w1").next_job(block=10)
+    queues.ack(r, lane, GROUP, message_id, data)
+    assert r.get("jobs:queued:abc") is None
+    assert r.xpending(lane, GROUP)["pending"] == 0
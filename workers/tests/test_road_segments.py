@@ -0,0 +1,10 @@
+from road_segments import geohash
+
+
+def test_geohash_known_value():
+    # Reference value from the geohash spec examples
+    assert geohash(57.64911, 10.40744, 11) == "u4pruydqqvj"
+
+
+def test_geohash_prefix_is_the_enclosing_cell():
+    assert geohash(57.64911, 10.40744, 5) == geohash(57.64911, 10.40744, 11)[:5]
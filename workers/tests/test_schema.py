@@ -0,0 +1,56 @@
+import json
+
+import pytest
+
+import schema
+
+mongomock = pytest.importorskip("mongomock")
+fakeredis = pytest.importorskip("fakeredis")
+
+import migrate  # noqa: E402
+
+
+def test_current_documents_need_no_upgrade():
+    doc = schema.new_video("v1", schema.SOURCE_RDD)
+    assert schema.upgrade(doc) is None
+
+
+def test_v1_cctv_document_is_upgraded():
+    doc = {"_id": "v1", "video_id": "v1", "source": "CCTV", "status": "PROCESSED", "gps_coords": [[1, 2]]}
+    update = schema.upgrade(doc)
+    fields = update["$set"]
+    assert fields["schema_version"] == schema.SCHEMA_VERSION
+    assert fields["source"] == schema.SOURCE_CCTV
+    assert fields["status"] == schema.DONE
+    # Defaults fill only missing fields
+    assert "gps_coords" not in fields
+    assert fields["attempts"] == 0
+    assert update["$unset"] == {"video_id": ""}
+
+
+def test_untagged_v1_document_is_rdd():
+    update = schema.upgrade({"_id": "v1", "status": "UPLOADED"})
+    assert update["$set"]["source"] == schema.SOURCE_RDD
+    assert "status" not in update["$set"]
+    assert "$unset" not in update
+
+
+def test_requeue_cctv_queues_only_unfinished_clips():
+    videos = mongomock.MongoClient().db.videos
+    videos.insert_many([
+        schema.new_video("stuck", schema.SOURCE_CCTV, gps_coords=[[1, 2]], priority="high"),
+        schema.new_video("running", schema.SOURCE_CCTV, status=schema.PROCESSING),
+        schema.new_video("done", schema.SOURCE_CCTV, status=schema.DONE),
+        schema.new_video("bulk", schema.SOURCE_CCTV, status=schema.PENDING_UPLOAD),
+        schema.new_video("rdd", schema.SOURCE_RDD),
+    ])
+    r = fakeredis.FakeRedis()
+
+    assert migrate.requeue_cctv(videos, r, dry_run=True) == 2
+    assert r.exists("vehicle_count_jobs:high", "vehicle_count_jobs") == 0
+
+    assert migrate.requeue_cctv(videos, r) == 2
+    [(_, high)] = r.xrange("vehicle_count_jobs:high")
+    assert high == {b"video_id": b"stuck", b"gps_coords": json.dumps([[1, 2]]).encode()}
+    [(_, normal)] = r.xrange("vehicle_count_jobs")
+    assert normal[b"video_id"] == b"running"
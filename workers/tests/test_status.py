@@ -0,0 +1,70 @@
+from status import StatusWriter
+
+
+class RecordingCollection:
+    def __init__(self):
+        self.writes = []
+
+    def bulk_write(self, ops, ordered=True):
+        self.writes.append({op._filter["_id"]: op._doc for op in ops})
+
+
+def test_updates_are_batched_until_flush():
+    coll = RecordingCollection()
+    status = StatusWriter(coll, interval=3600)
+    status.update("v1", {"progress": {"frame": 50}})
+    status.update("v2", {"progress": {"frame": 10}})
+    status.update("v1", {"progress": {"frame": 100}})
+    assert coll.writes == []
+
+    status.update("v1", {"status": "DONE"}, flush=True)
+    assert len(coll.writes) == 1
+    v1 = coll.writes[0]["v1"]
+    assert v1["$set"]["progress"] == {"frame": 100}
+    assert v1["$set"]["status"] == "DONE"
+    assert set(coll.writes[0]) == {"v1", "v2"}
+    # Empty operators are left out of the update
+    assert set(v1) == {"$set"}
+
+
+def test_max_pending_forces_a_flush():
+    coll = RecordingCollection()
+    status = StatusWriter(coll, interval=3600, max_pending=2)
+    status.update("v1", {"progress": 1})
+    status.update("v2", {"progress": 1})
+    assert len(coll.writes) == 1
+
+
+def test_pushes_accumulate():
+    coll = RecordingCollection()
+    status = StatusWriter(coll, interval=3600)
+    status.update("v1", push={"checkpoint.segments": [{"key": "a"}]})
+    status.update("v1", push={"checkpoint.segments": [{"key": "b"}]}, flush=True)
+    assert coll.writes[0]["v1"]["$push"] == {"checkpoint.segments": {"$each": [{"key": "a"}, {"key": "b"}]}}
+
+
+def test_unset_drops_queued_writes_to_the_field_and_below():
+    coll = RecordingCollection()
+    status = StatusWriter(coll, interval=3600)
+    status.update(
+        "v1",
+        {"checkpoint.frame": 100, "checkpoint_count": 3},
+        push={"checkpoint.segments": [{"key": "a"}]},
+    )
+    status.update("v1", {"status": "DONE"}, unset=("checkpoint",), flush=True)
+    update = coll.writes[0]["v1"]
+    # Mongo rejects $unset "checkpoint" next to $set "checkpoint.frame"
+    assert "checkpoint.frame" not in update["$set"]
+    assert update["$set"]["checkpoint_count"] == 3
+    assert "$push" not in update
+    assert update["$unset"] == {"checkpoint": ""}
+
+
+def test_set_after_unset_wins():
+    coll = RecordingCollection()
+    status = StatusWriter(coll, interval=3600)
+    status.update("v1", unset=("error",))
+    status.update("v1", {"error": "boom"}, flush=True)
+    update = coll.writes[0]["v1"]
+    assert update["$set"]["error"] == "boom"
+    assert "$unset" not in update
@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+# tiling pulls in the inference stack (OpenCV, ultralytics)
+pytest.importorskip("cv2")
+pytest.importorskip("ultralytics")
+
+from tiling import nms  # noqa: E402
+
+
+def test_nms_keeps_highest_confidence_of_overlapping_boxes():
+    dets = np.array([
+        [0, 0, 10, 10, 0.6, 0],
+        [1, 1, 11, 11, 0.9, 0],
+        [50, 50, 60, 60, 0.5, 0],
+    ], dtype=np.float32)
+    kept = nms(dets, iou_threshold=0.5)
+    assert kept[:, 4].tolist() == pytest.approx([0.9, 0.5])
+
+
+def test_nms_never_suppresses_across_classes():
+    dets = np.array([
+        [0, 0, 10, 10, 0.9, 0],
+        [0, 0, 10, 10, 0.8, 1],
+    ], dtype=np.float32)
+    assert len(nms(dets)) == 2
+
+
+def test_nms_empty():
+    assert len(nms(np.empty((0, 6), dtype=np.float32))) == 0
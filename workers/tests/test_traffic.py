@@ -0,0 +1,38 @@
+from datetime import datetime, timezone
+
+from traffic import _rollup_ops, minute_samples
+
+
+def test_minute_samples_buckets_crossings_by_wall_clock_minute():
+    recorded_at = datetime(2026, 5, 1, 8, 0, 30, tzinfo=timezone.utc)
+    # 10 fps, 90 s clip starting half-way through 08:00
+    crossings = [(0, "small", "car"), (250, "heavy", "truck"), (400, "small", "car"), (899, "medium", "bus")]
+    samples = minute_samples(crossings, recorded_at, fps=10, frame_count=900, camera_id="cam-1", video_id="v1")
+
+    assert [s["ts"].minute for s in samples] == [0, 1]
+    first, second = samples
+    assert (first["small"], first["heavy"], first["total"]) == (1, 1, 2)
+    assert (second["small"], second["medium"], second["total"]) == (1, 1, 2)
+    assert first["classes"] == {"car": 1, "truck": 1}
+    assert all(s["camera_id"] == "cam-1" and s["video_id"] == "v1" for s in samples)
+
+
+def test_minute_samples_emits_empty_minutes():
+    recorded_at = datetime(2026, 5, 1, 8, 0, 0, tzinfo=timezone.utc)
+    samples = minute_samples([], recorded_at, fps=25, frame_count=25 * 150, camera_id="cam-1", video_id="v1")
+    assert len(samples) == 3
+    assert all(s["total"] == 0 and s["classes"] == {} for s in samples)
+
+
+def test_rollups_skip_buckets_that_already_have_the_clip():
+    recorded_at = datetime(2026, 5, 1, 8, 59, 30, tzinfo=timezone.utc)
+    samples = minute_samples([(0, "heavy", "truck")], recorded_at, fps=10, frame_count=600,
+                             camera_id="cam-1", video_id="v1")
+    ops = _rollup_ops(samples, lambda ts: ts.replace(minute=0, second=0, microsecond=0))
+
+    # The clip spans 08:59 and 09:00, so two hourly buckets
+    assert len(ops) == 2
+    for op in ops:
+        assert op._filter["videos"] == {"$ne": "v1"}
+        assert op._doc["$push"]["videos"]["$each"] == ["v1"]
+    assert sorted(op._doc["$inc"]["heavy"] for op in ops) == [0, 1]
@@ -0,0 +1,146 @@
+"""
+Sliced (tiled) inference for small-object detection.
+
+Instead of letting YOLO shrink a whole 1080p/4K frame to its input size,
+the road region is cut into overlapping tiles at the model's native size.
+All tiles of a frame go through the model as one batch, optionally
+together with one coarse pass over the whole region so large damage that
+spans tiles is still found. Detections are shifted back to frame
+coordinates and merged across tiles with class-aware NMS.
+"""
+import numpy as np
+
+import inference
+from roi import RegionOfInterest
+
+
+def tile_origins(length: int, tile: int, overlap: float) -> list:
+    """Start offsets covering [0, length) with tiles of `tile` and the given overlap."""
+    if length <= tile:
+        return [0]
+    stride = max(1, int(tile * (1 - overlap)))
+    origins = list(range(0, length - tile, stride))
+    # Last tile flush with the edge so every tile is full size
+    origins.append(length - tile)
+    return origins
+
+
+def nms(detections: np.ndarray, iou_threshold: float = 0.5) -> np.ndarray:
+    """Class-aware NMS over [N, 6] rows of [x1, y1, x2, y2, conf, cls]."""
+    if len(detections) == 0:
+        return detections
+
+    # Offset boxes by class so different classes never overlap
+    offset = detections[:, 5:6] * (detections[:, :4].max() + 1)
+    boxes = detections[:, :4] + offset
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    order = np.argsort(-detections[:, 4])
+
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        tl = np.maximum(boxes[i, :2], boxes[rest, :2])
+        br = np.minimum(boxes[i, 2:], boxes[rest, 2:])
+        inter = np.prod(np.clip(br - tl, 0, None), axis=1)
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-9)
+        order = rest[iou <= iou_threshold]
+    return detections[keep]
+
+
+class TiledDetector:
+    def __init__(self, model, roi: RegionOfInterest, tile_size: int = 640, overlap: float = 0.2,
+                 conf: float = 0.25, iou: float = 0.5, full_pass: bool = True):
+        self.model = model
+        self.roi = roi
+        self.tile_size = tile_size
+        self.conf = conf
+        self.iou = iou
+        self.full_pass = full_pass
+
+        w = roi.x1 - roi.x0
+        h = roi.y1 - roi.y0
+        self.origins = [
+            (tx, ty)
+            for ty in tile_origins(h, tile_size, overlap)
+            for tx in tile_origins(w, tile_size, overlap)
+        ]
+
+    def __call__(self, frame: np.ndarray) -> np.ndarray:
+        region = self.roi.crop(frame)
+        t = self.tile_size
+        tiles = [region[ty:ty + t, tx:tx + t] for tx, ty in self.origins]
+
+        merged = []
+        for (tx, ty), dets in zip(
+            self.origins,
+            inference.detect(self.model, tiles, imgsz=t, conf=self.conf),
+        ):
+            if len(dets):
+                dets[:, [0, 2]] += tx
+                dets[:, [1, 3]] += ty
+                merged.append(dets)
+
+        if self.full_pass and len(self.origins) > 1:
+            merged.append(inference.detect(self.model, region, imgsz=t, conf=self.conf))
+
+        if not merged:
+            return np.empty((0, 6), dtype=np.float32)
+        return self.roi.to_frame(nms(np.concatenate(merged), self.iou))
+
+
+def decode_size(spec: dict, source_w: int, source_h: int) -> tuple:
+    """
+    Smallest (width, height) to decode at without losing inference detail:
+    the ROI's long side lands on the model input size. Tiled jobs need full
+    resolution.
+    """
+    if spec.get("tiling"):
+        return source_w, source_h
+    roi = RegionOfInterest(spec.get("roi"), source_w, source_h)
+    imgsz = spec.get("imgsz") or inference.DEFAULT_IMGSZ
+    scale = min(1.0, imgsz / max(roi.x1 - roi.x0, roi.y1 - roi.y0))
+    return round(source_w * scale), round(source_h * scale)
+
+
+def build_detector(model, spec: dict, frame_w: int, frame_h: int):
+    """
+    Build the per-job detection function from a plain (picklable) spec:
+    {"roi": polygon or None, "tiling": {"tile_size", "overlap"} or None,
+     "imgsz": int or None, "conf": float, "source_size": [w, h] or None}.
+
+    The returned callable maps a decoded frame to [N, 6] detections. When
+    frames were downscaled at decode, `source_size` gives the original
+    resolution and detections are scaled back to it, so tracking and
+    counting always work in source-frame coordinates.
+    """
+    roi = RegionOfInterest(spec.get("roi"), frame_w, frame_h)
+    conf = spec.get("conf", 0.25)
+    tiling = spec.get("tiling")
+    if tiling:
+        detect = TiledDetector(
+            model,
+            roi,
+            tile_size=tiling.get("tile_size", inference.DEFAULT_IMGSZ),
+            overlap=tiling.get("overlap", 0.2),
+            conf=conf,
+        )
+    else:
+        imgsz = spec.get("imgsz") or inference.DEFAULT_IMGSZ
+
+        def detect(frame):
+            return roi.to_frame(inference.detect(model, roi.crop(frame), imgsz=imgsz, conf=conf))
+
+    source_w, source_h = spec.get("source_size") or (frame_w, frame_h)
+    if (source_w, source_h) == (frame_w, frame_h):
+        return detect
+
+    scale = np.array([source_w / frame_w, source_h / frame_h] * 2, dtype=np.float32)
+
+    def detect_scaled(frame):
+        detections = detect(frame)
+        detections[:, :4] *= scale
+        return detections
+
+    return detect_scaled
@@ -0,0 +1,195 @@
+"""
+Time-bucketed CCTV traffic counts.
+
+Every counted vehicle is attributed to the minute of the clip it crossed the
+count line in. A CCTV job then writes:
+
+    traffic_samples  one document per camera per minute covered by the clip
+                     (zero-count minutes included) in a MongoDB time-series
+                     collection, expired after TRAFFIC_SAMPLE_TTL_DAYS
+    traffic_hourly   precomputed per-camera hourly rollups ($inc upserts)
+    traffic_daily    the same per day
+    cameras          latest severity per sliding window
+
+Writes are safe to repeat for the same clip: samples already stored are
+skipped and rollup buckets remember the clips folded into them, so a
+retried job never counts its vehicles twice.
+
+Rollups carry the number of observed minutes next to the counts, so
+severity is a rate (weighted vehicles per hour of footage) and a 10-minute
+clip is scored on the same scale as a 6-hour one. Windows are configured
+with TRAFFIC_SEVERITY_WINDOWS (hours, default "1,24") and end at the
+camera's latest sample.
+"""
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ASCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, CollectionInvalid
+
+VEHICLE_TYPES = ("small", "medium", "heavy")
+SEVERITY_WEIGHTS = {"small": 1, "medium": 2, "heavy": 3}
+
+# Weighted vehicles per hour; above the last limit is Critical
+SEVERITY_LEVELS = [(300, "Good"), (720, "Moderate"), (1500, "Poor")]
+SEVERITY_WINDOWS = [
+    int(h) for h in os.getenv("TRAFFIC_SEVERITY_WINDOWS", "1,24").split(",") if h.strip()
+]
+SAMPLE_TTL_DAYS = int(os.getenv("TRAFFIC_SAMPLE_TTL_DAYS", "400"))
+# Clip ids kept per rollup bucket to skip re-applied clips
+RECENT_VIDEOS = 50
+
+
+def ensure_collections(db):
+    try:
+        db.create_collection(
+            "traffic_samples",
+            timeseries={"timeField": "ts", "metaField": "camera_id", "granularity": "minutes"},
+            expireAfterSeconds=SAMPLE_TTL_DAYS * 86400,
+        )
+    except CollectionInvalid:
+        pass  # Already created (possibly by another worker)
+    db.traffic_samples.create_index([("camera_id", ASCENDING), ("ts", ASCENDING)])
+    for name in ("traffic_hourly", "traffic_daily"):
+        db[name].create_index([("camera_id", ASCENDING), ("bucket", ASCENDING)], unique=True)
+
+
+def compute_severity(totals: dict, hours: float) -> str:
+    """Severity of `totals` counted over `hours` of footage."""
+    score = sum(w * totals.get(k, 0) for k, w in SEVERITY_WEIGHTS.items())
+    rate = score / max(hours, 1 / 60)
+    for limit, level in SEVERITY_LEVELS:
+        if rate < limit:
+            return level
+    return "Critical"
+
+
+def _utc(ts: datetime) -> datetime:
+    # pymongo hands back naive datetimes that are already UTC
+    return ts.replace(tzinfo=timezone.utc) if ts.tzinfo is None else ts.astimezone(timezone.utc)
+
+
+def minute_samples(crossings: list, recorded_at: datetime, fps: float, frame_count: int,
+                   camera_id: str, video_id: str) -> list:
+    """
+    One sample per minute of the clip from (frame_idx, vehicle_type, class)
+    crossings; `recorded_at` is the wall-clock time of the first frame.
+    """
+    start = _utc(recorded_at)
+    first_minute = start.replace(second=0, microsecond=0)
+    offset = (start - first_minute).total_seconds()
+    # Up to the minute of the last frame; a clip ending on a minute boundary
+    # adds no empty sample for the next minute
+    n_minutes = int((offset + max(frame_count - 1, 0) / fps) // 60) + 1
+
+    samples = [
+        {
+            "ts": first_minute + timedelta(minutes=m),
+            "camera_id": camera_id,
+            "video_id": video_id,
+            **{k: 0 for k in VEHICLE_TYPES},
+            "total": 0,
+            "classes": defaultdict(int),
+        }
+        for m in range(n_minutes)
+    ]
+    for frame_idx, vtype, vclass in crossings:
+        s = samples[min(int((offset + frame_idx / fps) // 60), n_minutes - 1)]
+        s[vtype] += 1
+        s["total"] += 1
+        s["classes"][vclass] += 1
+    for s in samples:
+        s["classes"] = dict(s["classes"])
+    return samples
+
+
+def _rollup_ops(samples: list, floor) -> list:
+    buckets = defaultdict(lambda: defaultdict(int))
+    for s in samples:
+        inc = buckets[(s["camera_id"], s["video_id"], floor(s["ts"]))]
+        inc["minutes"] += 1
+        for k in (*VEHICLE_TYPES, "total"):
+            inc[k] += s[k]
+        for cls, n in s["classes"].items():
+            inc[f"classes.{cls}"] += n
+
+    now = datetime.now(timezone.utc)
+    return [
+        UpdateOne(
+            {"camera_id": camera_id, "bucket": bucket, "videos": {"$ne": video_id}},
+            {
+                "$inc": dict(inc),
+                "$set": {"updated_at": now},
+                "$push": {"videos": {"$each": [video_id], "$slice": -RECENT_VIDEOS}},
+            },
+            upsert=True,
+        )
+        for (camera_id, video_id, bucket), inc in buckets.items()
+    ]
+
+
+def _rollup(collection, ops: list):
+    try:
+        collection.bulk_write(ops, ordered=False)
+    except BulkWriteError as e:
+        # A bucket that already has this clip misses the filter, and its
+        # upsert collides with the unique (camera_id, bucket) index
+        if any(err["code"] != 11000 for err in e.details["writeErrors"]):
+            raise
+
+
+def window_severity(hourly, camera_id: str, end: datetime, hours: int):
+    """Severity over the `hours` hourly buckets ending at `end`, or None without data."""
+    start = end.replace(minute=0, second=0, microsecond=0) - timedelta(hours=hours - 1)
+    rows = list(hourly.aggregate([
+        {"$match": {"camera_id": camera_id, "bucket": {"$gte": start, "$lte": end}}},
+        {"$group": {"_id": None, "minutes": {"$sum": "$minutes"},
+                    **{k: {"$sum": f"${k}"} for k in VEHICLE_TYPES}}},
+    ]))
+    if not rows or not rows[0]["minutes"]:
+        return None
+    return compute_severity(rows[0], rows[0]["minutes"] / 60)
+
+
+def record(db, samples: list, camera_id: str, location=None):
+    """Store a clip's minute samples, fold them into the rollups and re-score the camera."""
+    if not samples:
+        return
+    stored = {
+        _utc(d["ts"])
+        for d in db.traffic_samples.find(
+            {
+                "camera_id": camera_id,
+                "ts": {"$gte": samples[0]["ts"], "$lte": samples[-1]["ts"]},
+                "video_id": samples[0]["video_id"],
+            },
+            {"ts": 1},
+        )
+    }
+    missing = [s for s in samples if s["ts"] not in stored]
+    if missing:
+        db.traffic_samples.insert_many(missing, ordered=False)
+    _rollup(db.traffic_hourly, _rollup_ops(samples, lambda ts: ts.replace(minute=0, second=0, microsecond=0)))
+    _rollup(db.traffic_daily,
+            _rollup_ops(samples, lambda ts: ts.replace(hour=0, minute=0, second=0, microsecond=0)))
+
+    now = datetime.now(timezone.utc)
+    camera = db.cameras.find_one_and_update(
+        {"_id": camera_id},
+        {
+            "$max": {"last_sample_at": samples[-1]["ts"]},
+            "$set": {"updated_at": now, **({"location": location} if location else {})},
+            "$setOnInsert": {"created_at": now},
+        },
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    end = _utc(camera["last_sample_at"])
+    db.cameras.update_one(
+        {"_id": camera_id},
+        {"$set": {
+            "severity": {f"{h}h": window_severity(db.traffic_hourly, camera_id, end, h) for h in SEVERITY_WINDOWS},
+            "severity_at": end,
+        }},
+    )
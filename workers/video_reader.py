@@ -0,0 +1,166 @@
+"""
+Threaded video reader that scales to inference size during decode.
+
+cv2.VideoCapture.read() always decodes and colour-converts at full source
+resolution into a fresh array, only for the model to shrink it again.
+VideoReader decodes with PyAV (FFmpeg) using codec frame/slice threading
+on a background thread, lets swscale resize and convert to BGR in the
+same pass, and copies each frame straight into a caller-provided buffer
+(e.g. a reused array or a shared-memory ring slot). Time ranges seek to
+the nearest keyframe and decode forward to the exact start frame; frame
+times are measured from the stream's start_time, which MPEG-TS and many
+camera recordings do not start at zero.
+
+Without PyAV installed it falls back to OpenCV with the same interface.
+"""
+import queue
+import threading
+
+import cv2
+import numpy as np
+
+try:
+    import av
+except ImportError:
+    av = None
+
+_EOF = object()
+
+
+def _even(v: float) -> int:
+    return max(2, int(round(v / 2)) * 2)
+
+
+class VideoReader:
+    def __init__(self, path: str, size: tuple = None, start_frame: int = 0,
+                 end_seconds: float = None, threads: int = 0, prefetch: int = 8):
+        """
+        size:        (width, height) to decode to; None keeps source resolution
+        start_frame: first frame index to return (resume / time-range start)
+        end_seconds: stop after this timestamp
+        threads:     decoder threads (0 = FFmpeg picks)
+        """
+        self.path = path
+        self.start_frame = start_frame
+        self.end_seconds = end_seconds
+
+        if av is not None:
+            self.container = av.open(path)
+            self.stream = self.container.streams.video[0]
+            self.stream.thread_type = "AUTO"
+            self.stream.thread_count = threads
+            self.width = self.stream.codec_context.width
+            self.height = self.stream.codec_context.height
+            self.fps = float(self.stream.average_rate or 25.0)
+            self.frame_count = self.stream.frames or 0
+        else:
+            self.cap = cv2.VideoCapture(path)
+            if not self.cap.isOpened():
+                raise RuntimeError("Cannot open video")
+            self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+            self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 25.0
+            self.frame_count = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+        if size is None or tuple(size) == (self.width, self.height):
+            self.out_w, self.out_h = self.width, self.height
+        else:
+            self.out_w, self.out_h = _even(size[0]), _even(size[1])
+        self.shape = (self.out_h, self.out_w, 3)
+
+        self.frames = queue.Queue(maxsize=prefetch)
+        self.stop = threading.Event()
+        self.thread = None
+
+    @property
+    def scaled(self) -> bool:
+        return (self.out_w, self.out_h) != (self.width, self.height)
+
+    # ---------- DECODE THREAD ----------
+    def _put(self, item) -> bool:
+        while not self.stop.is_set():
+            try:
+                self.frames.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _decode_av(self):
+        tb = self.stream.time_base
+        origin = self.stream.start_time or 0
+        start_t = self.start_frame / self.fps
+        if self.start_frame:
+            # Land on the keyframe before the start, then decode forward
+            self.container.seek(origin + int(start_t / tb), stream=self.stream, backward=True)
+
+        for frame in self.container.decode(self.stream):
+            if frame.pts is None:
+                continue
+            t = float((frame.pts - origin) * tb)
+            if t < start_t - 0.5 / self.fps:
+                continue
+            if self.end_seconds is not None and t >= self.end_seconds:
+                break
+            # swscale does the resize and the BGR conversion in one pass
+            out = frame.reformat(width=self.out_w, height=self.out_h, format="bgr24")
+            if not self._put(out):
+                return
+
+    def _decode_cv2(self):
+        if self.start_frame:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, self.start_frame)
+        index = self.start_frame
+        full = None
+        while not self.stop.is_set():
+            ok, full = self.cap.read(full)
+            if not ok:
+                break
+            if self.end_seconds is not None and index / self.fps >= self.end_seconds:
+                break
+            index += 1
+            if not self._put(cv2.resize(full, (self.out_w, self.out_h), interpolation=cv2.INTER_AREA)
+                             if self.scaled else full.copy()):
+                return
+
+    def _run(self):
+        try:
+            if av is not None:
+                self._decode_av()
+            else:
+                self._decode_cv2()
+        except Exception as e:
+            self._put(e)
+        self._put(_EOF)
+
+    # ---------- CONSUMER ----------
+    def read_into(self, buf: np.ndarray) -> bool:
+        """Copy the next frame into `buf` (shape self.shape); False at the end."""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+        item = self.frames.get()
+        if item is _EOF:
+            self.frames.put(_EOF)
+            return False
+        if isinstance(item, Exception):
+            raise item
+
+        if isinstance(item, np.ndarray):
+            np.copyto(buf, item)
+        else:
+            # View the libav plane in place (rows may be padded), one copy out
+            plane = item.planes[0]
+            rows = np.frombuffer(plane, dtype=np.uint8).reshape(self.out_h, plane.line_size)
+            np.copyto(buf, rows[:, : self.out_w * 3].reshape(self.shape))
+        return True
+
+    def close(self):
+        self.stop.set()
+        if self.thread is not None:
+            self.thread.join(timeout=5)
+        if av is not None:
+            self.container.close()
+        else:
+            self.cap.release()